@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+import config
+
+# Signed access tokens.
+#
+# POST /login checks the password with bcrypt once and returns a token
+# "<payload>.<signature>": the payload is base64url JSON {"sub": user id,
+# "exp": expiry timestamp} and the signature its HMAC-SHA256 with
+# AUTH_SECRET. Later requests send it as `Authorization: Bearer <token>`
+# and are authenticated by recomputing the HMAC, a few microseconds instead
+# of a bcrypt verification. The token carries no role: the role of the
+# caller is read through the cache (crud.get_user_role), so a role change or
+# a deleted user takes effect before the token expires.
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(
+        config.AUTH_SECRET.encode(), payload.encode(), hashlib.sha256
+    ).digest()
+    return _b64encode(digest)
+
+
+def issue_token(user_id: int, ttl: Optional[int] = None) -> str:
+    ttl = config.AUTH_TOKEN_TTL if ttl is None else ttl
+    claims = {"sub": user_id, "exp": int(time.time()) + ttl}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str) -> int:
+    """Return the user id of a valid token, raise InvalidToken otherwise."""
+    payload, _, signature = token.partition(".")
+    # compared as bytes: compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        raise InvalidToken("bad signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+        user_id, expires_at = int(claims["sub"]), claims["exp"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken("malformed token")
+    if expires_at < time.time():
+        raise InvalidToken("expired token")
+    return user_id
+
+
+bearer = HTTPBearer(auto_error=False)
+
+
+async def token_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+) -> Optional[int]:
+    """Id of the user of the bearer token, None when there is no token."""
+    if credentials is None:
+        return None
+    try:
+        return decode_token(credentials.credentials)
+    except InvalidToken as e:
+        raise HTTPException(
+            status_code=401,
+            detail=f"invalid token: {e}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def caller_id(
+    user_id: Optional[int] = None,
+    token_user: Optional[int] = Depends(token_user_id),
+) -> int:
+    """
+    The user making the request: the bearer token when there is one, else
+    the legacy `user_id` query parameter (refused with AUTH_REQUIRED).
+    """
+    if token_user is not None:
+        return token_user
+    if user_id is None or config.AUTH_REQUIRED:
+        raise HTTPException(
+            status_code=401,
+            detail="authentication required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
@@ -0,0 +1,124 @@
+"""
+Throughput of authenticated requests: password on every request vs token.
+
+The same authenticated update (PUT /user_update/{id}) is sent with the
+legacy password parameter, verified with bcrypt on every request, then with
+a bearer token obtained once from POST /login and checked with an HMAC.
+The app is driven in-process through httpx's ASGI transport.
+
+    python -m benchmarks.auth --requests 200 --rounds 12
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+
+async def drive(app, requests: int, concurrency: int, user_id, auth):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        headers, params = {}, {}
+        if auth == "token":
+            response = await client.post(
+                "/login", json={"login": "bench", "password": "password"}
+            )
+            response.raise_for_status()
+            token = response.json()["access_token"]
+            headers["Authorization"] = f"Bearer {token}"
+        else:
+            params["password"] = "password"
+
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.put(
+                    f"/user_update/{user_id}",
+                    params=params,
+                    headers=headers,
+                    json={
+                        "name": f"bench {i}",
+                        "login": "bench",
+                        "phone": "000",
+                        "role": "user",
+                    },
+                )
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default="sqlite:///./bench_auth.db")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--rounds", type=int, default=12, help="bcrypt cost (BCRYPT_ROUNDS)"
+    )
+    parser.add_argument("--output", default="bench_auth.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # the app runs in this process: keep its in-memory cache
+    os.environ["WEB_CONCURRENCY"] = "1"
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    from sqlalchemy import select, update
+
+    import database
+    import main as app_module
+    import models
+    from utils import hash_password
+
+    reset_schema(database.engine)
+    seed(database.engine, 100, num_users=10, num_courses=10)
+    with database.engine.begin() as conn:
+        user_id = conn.scalar(
+            select(models.User.id).where(models.User.role == "user").limit(1)
+        )
+        conn.execute(
+            update(models.User)
+            .where(models.User.id == user_id)
+            .values(login="bench", password=hash_password("password"))
+        )
+
+    results = []
+    for auth in ("password", "token"):
+        rps, latencies = asyncio.run(
+            drive(
+                app_module.app,
+                args.requests,
+                args.concurrency,
+                user_id,
+                auth,
+            )
+        )
+        result = {
+            "auth": auth,
+            "bcrypt_rounds": args.rounds,
+            "requests_per_sec": round(rps, 1),
+            "latency": summarize(latencies),
+        }
+        print(result)
+        results.append(result)
+    save_results(args.output, "auth", results)
+
+
+if __name__ == "__main__":
+    main()
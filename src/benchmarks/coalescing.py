@@ -0,0 +1,105 @@
+"""
+Bursts of identical list requests with and without the single-flight.
+
+Each round sends `--burst` identical requests at once (the first page of an
+endpoint, as after a notification sent to every client), through httpx's
+ASGI transport, and the rounds follow each other without pause. The runs
+compare no coalescing, the single-flight alone and the single-flight with a
+one second micro-cache, and report the requests/sec, the latency and the
+number of requests that actually ran the queries.
+
+    python -m benchmarks.coalescing --students 100000 --burst 200
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+ENDPOINTS = ("/courses?limit=15", "/students?limit=15&count=exact")
+MODES = {"off": (False, 0), "single-flight": (True, 0), "ttl=1s": (True, 1)}
+
+
+async def drive(app, path: str, rounds: int, burst: int):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def request():
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*[request() for _ in range(burst)])
+        elapsed = time.perf_counter() - start
+    return rounds * burst / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url", default="sqlite:///./bench_coalescing.db"
+    )
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--output", default="bench_coalescing.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # the app runs in this process: keep its in-memory cache
+    os.environ["WEB_CONCURRENCY"] = "1"
+    import coalesce
+    import config
+    import database
+    import main as app_module
+
+    reset_schema(database.engine)
+    seed(database.engine, args.students, num_users=1000, num_courses=200)
+
+    async def run_all():
+        results = []
+        app = app_module.app
+        async with app.router.lifespan_context(app):
+            for path in ENDPOINTS:
+                for mode, (enabled, ttl) in MODES.items():
+                    config.COALESCE_REQUESTS = enabled
+                    coalesce.single_flight = coalesce.SingleFlight(ttl=ttl)
+                    await drive(app, path, 1, 10)  # warm up
+                    rps, latencies = await drive(
+                        app, path, args.rounds, args.burst
+                    )
+                    results.append(
+                        {
+                            "endpoint": path,
+                            "mode": mode,
+                            "requests_per_sec": round(rps, 1),
+                            "latency": summarize(latencies),
+                            **coalesce.single_flight.stats(),
+                        }
+                    )
+                    print(results[-1])
+        return results
+
+    save_results(
+        args.output,
+        "coalescing",
+        {
+            "students": args.students,
+            "burst": args.burst,
+            "runs": asyncio.run(run_all()),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+# Shared helpers for the scripts of this package. Every benchmark is run
+# from the src directory, e.g. `python -m benchmarks.student_loading`.
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(
+        len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1)))
+    )
+    return ordered[index]
+
+
+def summarize(latencies) -> dict:
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(latencies),
+        "mean_ms": (
+            round(statistics.fmean(latencies) * 1000, 3) if latencies else 0
+        ),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(path: str, name: str, results) -> None:
+    """Write results as JSON with enough context to compare two commits."""
+    payload = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"results written to {path}")
+
+
+def reset_schema(engine) -> None:
+    """Drop every table, then apply the migrations, as seed() expects."""
+    from sqlalchemy import text
+
+    from database import Base
+    from database_populate import upgrade_schema
+    import models  # noqa: F401  (registers the tables on Base.metadata)
+
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    upgrade_schema(engine)
+
+
+def seed(
+    engine,
+    num_students: int,
+    num_users: int = 100,
+    num_courses: int = 50,
+    workers: int = 1,
+) -> dict:
+    """Seed with the bulk mode of database_populate, returns its report."""
+    from database_populate import bulk_create_fake_data
+
+    return bulk_create_fake_data(
+        engine.url.render_as_string(hide_password=False),
+        num_users,
+        num_courses,
+        num_students,
+        seed=42,
+        workers=workers,
+    )
@@ -0,0 +1,291 @@
+"""
+Load test of the API: start the app, seed it and drive a realistic mix.
+
+The app from main.py is started with uvicorn in a subprocess against a
+local database (a SQLite file by default), seeded with the bulk mode of
+database_populate.py, then concurrent clients send a weighted mix of list
+pages, bulk student creations, updates, deletes and password-verified user
+updates for a fixed duration. Latency percentiles and throughput are
+reported per operation and saved as JSON, so two commits can be compared.
+Everything runs offline on one machine.
+
+    python -m benchmarks.load_test --students 100000 --duration 30
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+DEFAULT_MIX = {
+    "list_courses": 25,
+    "list_students": 25,
+    "list_users": 10,
+    "create_students": 10,
+    "update_students": 10,
+    "delete_students": 5,
+    "update_user": 5,
+}
+
+
+class LoadTest:
+    def __init__(self, client, admin_id, user_ids, num_courses, batch):
+        self.client = client
+        self.admin_id = admin_id
+        self.user_ids = user_ids
+        self.num_courses = num_courses
+        self.batch = batch
+        self.created = []  # ids of students created by the run
+        self.rng = random.Random(42)
+
+    def student_payload(self):
+        return {
+            "name": f"load student {self.rng.randint(0, 10**6)}",
+            "lab": "load",
+            "user_id": self.rng.choice(self.user_ids),
+            "course_id": self.rng.sample(
+                range(1, self.num_courses + 1), self.rng.randint(1, 3)
+            ),
+        }
+
+    async def list_courses(self):
+        return await self.client.get("/courses", params={"limit": 15})
+
+    async def list_users(self):
+        return await self.client.get("/users", params={"limit": 15})
+
+    async def list_students(self):
+        # first pages and deeper pages reached through a cursor
+        response = await self.client.get("/students", params={"limit": 15})
+        cursor = response.headers.get("x-next-cursor")
+        if cursor and self.rng.random() < 0.5:
+            response = await self.client.get(
+                "/students", params={"limit": 15, "cursor": cursor}
+            )
+        return response
+
+    async def create_students(self):
+        response = await self.client.post(
+            "/create_students/bulk",
+            params={"user_id": self.admin_id},
+            json=[self.student_payload() for _ in range(self.batch)],
+        )
+        if response.status_code == 200:
+            self.created.extend(s["id"] for s in response.json()["created"])
+        return response
+
+    async def update_students(self):
+        if not self.created:
+            return await self.create_students()
+        ids = self.rng.sample(self.created, min(len(self.created), 10))
+        return await self.client.put(
+            "/student_update/",
+            params={"user_id": self.admin_id},
+            json=[
+                {"id": i, "lab": f"lab {self.rng.randint(0, 9)}"} for i in ids
+            ],
+        )
+
+    async def delete_students(self):
+        if len(self.created) < 10:
+            return await self.create_students()
+        ids = [self.created.pop() for _ in range(10)]
+        return await self.client.request(
+            "DELETE",
+            "/delete_student/",
+            params={"user_id": self.admin_id},
+            json=[{"id": i} for i in ids],
+        )
+
+    async def update_user(self):
+        user_id = self.rng.choice(self.user_ids)
+        return await self.client.put(
+            f"/user_update/{user_id}",
+            params={"password": "password"},
+            json={
+                "name": "load user",
+                "login": f"load{user_id}",
+                "phone": "000",
+                "role": "user",
+            },
+        )
+
+
+async def run_mix(
+    base_url,
+    duration,
+    concurrency,
+    mix,
+    admin_id,
+    user_ids,
+    num_courses,
+    batch,
+):
+    import httpx
+
+    stats = {name: {"latencies": [], "errors": 0} for name in mix}
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        test = LoadTest(client, admin_id, user_ids, num_courses, batch)
+        deadline = time.perf_counter() + duration
+
+        async def worker(worker_id):
+            rng = random.Random(worker_id)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await getattr(test, name)()
+                    failed = response.status_code >= 400
+                except Exception:
+                    failed = True
+                stats[name]["latencies"].append(time.perf_counter() - start)
+                stats[name]["errors"] += failed
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    results = {}
+    for name, data in stats.items():
+        results[name] = {
+            "throughput_per_sec": round(len(data["latencies"]) / elapsed, 1),
+            "errors": data["errors"],
+            "latency": summarize(data["latencies"]),
+        }
+    total = sum(len(data["latencies"]) for data in stats.values())
+    results["total"] = {"throughput_per_sec": round(total / elapsed, 1)}
+    return results
+
+
+def start_app(port: int, env: dict):
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    return process
+
+
+def wait_until_ready(base_url: str, timeout: float = 30):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"{base_url}/courses").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("the app did not start")
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"unknown operation {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default="sqlite:///./bench_load.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--batch", type=int, default=50, help="students per bulk creation"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="e.g. list_courses=5,update_user=1",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--output", default="bench_load_test.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    from sqlalchemy import create_engine, select
+
+    import models
+
+    engine = create_engine(args.database_url)
+    seeding = None
+    if not args.skip_seed:
+        reset_schema(engine)
+        seeding = seed(engine, args.students, args.users, args.courses)
+    with engine.connect() as conn:
+        admin_id = conn.scalar(
+            select(models.User.id).where(models.User.role == "admin").limit(1)
+        )
+        user_ids = list(
+            conn.scalars(
+                select(models.User.id).where(models.User.role == "user")
+            )
+        )
+    engine.dispose()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    app = start_app(args.port, dict(os.environ))
+    try:
+        wait_until_ready(base_url)
+        results = asyncio.run(
+            run_mix(
+                base_url,
+                args.duration,
+                args.concurrency,
+                args.mix,
+                admin_id,
+                user_ids,
+                args.courses,
+                args.batch,
+            )
+        )
+    finally:
+        app.terminate()
+        app.wait()
+
+    for name, result in results.items():
+        print(name, result)
+    save_results(
+        args.output,
+        "load_test",
+        {
+            "config": {
+                "students": args.students,
+                "duration": args.duration,
+                "concurrency": args.concurrency,
+                "mix": args.mix,
+                "database": engine.dialect.name,
+            },
+            "seeding": seeding,
+            "operations": results,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
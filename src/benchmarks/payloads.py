@@ -0,0 +1,104 @@
+"""
+Parse and serialize cost of batch payloads of 1k, 10k and 100k students.
+
+Input, a JSON list of StudentCreate:
+  union       json.loads, then validation against List[Model] | Model, as
+              FastAPI does for a parameter declared with that union
+  orjson      orjson.loads, then validation against List[Model]
+  fast path   TypeAdapter(List[Model]).validate_json on the raw bytes, as
+              payloads.body does
+Output, the rows returned by INSERT ... RETURNING:
+  response_model  validation against List[Student], then dump_json, as
+                  FastAPI does for the response_model of a handler
+  lean            orjson.dumps of the rows, as FastJSONResponse does
+
+No database is involved. The best of `--repeat` runs is reported.
+
+    python -m benchmarks.payloads --sizes 1000 10000 100000
+"""
+
+import argparse
+import json
+import time
+from typing import List, Union
+
+from benchmarks.common import save_results
+
+
+def best_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_payloads.json")
+    args = parser.parse_args()
+
+    import orjson
+    from pydantic import TypeAdapter
+
+    import schema
+    from responses import dumps
+
+    union = TypeAdapter(
+        Union[List[schema.StudentCreate], schema.StudentCreate]
+    )
+    many = TypeAdapter(List[schema.StudentCreate])
+    response_model = TypeAdapter(List[schema.Student])
+
+    results = []
+    for size in args.sizes:
+        body = json.dumps(
+            [
+                {
+                    "name": f"student {i}",
+                    "lab": "lab",
+                    "user_id": i % 100 + 1,
+                    "course_id": [1, 2, 3],
+                }
+                for i in range(size)
+            ]
+        ).encode()
+        rows = [
+            {"id": i, "name": f"student {i}", "lab": "lab", "user_id": 1}
+            for i in range(size)
+        ]
+        parse = {
+            "union": lambda: union.validate_python(json.loads(body)),
+            "orjson": lambda: many.validate_python(orjson.loads(body)),
+            "fast path": lambda: many.validate_json(body),
+        }
+        serialize = {
+            "response_model": lambda: response_model.dump_json(
+                response_model.validate_python(rows)
+            ),
+            "lean": lambda: dumps(rows),
+        }
+        result = {
+            "items": size,
+            "body_bytes": len(body),
+            "parse_ms": {
+                name: best_ms(func, args.repeat)
+                for name, func in parse.items()
+            },
+            "serialize_ms": {
+                name: best_ms(func, args.repeat)
+                for name, func in serialize.items()
+            },
+        }
+        print(result)
+        results.append(result)
+    save_results(args.output, "payloads", results)
+
+
+if __name__ == "__main__":
+    main()
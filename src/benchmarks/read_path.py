@@ -0,0 +1,88 @@
+"""
+Requests/sec of the list endpoints with READ_PATH=orm versus READ_PATH=core.
+
+The app is driven in-process through httpx's ASGI transport, so the numbers
+isolate the cost of the handler (query, ORM hydration, validation and JSON
+encoding) from the network.
+
+    python -m benchmarks.read_path --students 10000 --requests 500
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+ENDPOINTS = ("/users?limit=50", "/courses?limit=50", "/students?limit=50")
+
+
+async def drive(app, path: str, requests: int, concurrency: int):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(path)
+
+        async def worker():
+            while not queue.empty():
+                url = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url", default="sqlite:///./bench_read_path.db"
+    )
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", default="bench_read_path.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # both paths run every query: no page cache, no request coalescing
+    os.environ["CACHE_BACKEND"] = "none"
+    import config
+    import database
+    import main as app_module
+
+    reset_schema(database.engine)
+    seed(database.engine, args.students, num_users=1000, num_courses=200)
+
+    config.COALESCE_REQUESTS = False
+    results = []
+    for path in ENDPOINTS:
+        for read_path in ("orm", "core"):
+            config.READ_PATH = read_path
+            rps, latencies = asyncio.run(
+                drive(app_module.app, path, args.requests, args.concurrency)
+            )
+            result = {
+                "endpoint": path,
+                "read_path": read_path,
+                "requests_per_sec": round(rps, 1),
+                "latency": summarize(latencies),
+            }
+            print(result)
+            results.append(result)
+    save_results(args.output, "read_path", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Latency of the filtered and searched list endpoints.
+
+The database is seeded with the bulk mode of database_populate, then every
+query below is sent repeatedly to the app (in-process, through httpx's ASGI
+transport) with its search terms drawn from the seeded names. The same
+name searches are also timed as a plain `LIKE '%term%'` scan of the
+students table, without the trigram / FTS indexes, for comparison: with a
+common term the scan stops after the first page of matches, with a term
+matching nothing it reads the whole table. The
+target is a p95 below 10 ms with 1M students.
+
+    python -m benchmarks.search --students 1000000 --requests 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+
+def queries(names, labs, user_ids, course_ids, rng):
+    """Query strings of each kind of request, drawn from the seeded data."""
+
+    def term():
+        word = rng.choice(rng.choice(names).split())
+        start = rng.randrange(max(1, len(word) - 3))
+        return word[start : start + 4]
+
+    def missing_term():
+        # no match at all: a scan reads the whole table to find it out
+        return "".join(rng.choice("qxzj") for _ in range(4))
+
+    return {
+        "students?name": lambda: {"name": term()},
+        "students?name (no match)": lambda: {"name": missing_term()},
+        "students?lab": lambda: {"lab": rng.choice(labs)},
+        "students?user_id": lambda: {"user_id": rng.choice(user_ids)},
+        "students?course_id": lambda: {"course_id": rng.choice(course_ids)},
+        "students?name&lab": lambda: {
+            "name": term(),
+            "lab": rng.choice(labs),
+        },
+        "users?name": lambda: {"name": term()},
+    }
+
+
+async def drive(app, path: str, make_params, requests: int):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for _ in range(requests):
+            params = {"limit": 15, **make_params()}
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return latencies
+
+
+def scan_latencies(engine, make_params, requests: int):
+    """The name search as a LIKE scan, which no index can serve."""
+    from sqlalchemy import select
+
+    import models
+
+    latencies = []
+    with engine.connect() as conn:
+        for _ in range(requests):
+            pattern = f"%{make_params()['name']}%"
+            start = time.perf_counter()
+            conn.execute(
+                select(models.Student.id, models.Student.name)
+                .where(models.Student.name.like(pattern))
+                .order_by(models.Student.id)
+                .limit(16)
+            ).all()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url", default="sqlite:///./bench_search.db"
+    )
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default="bench_search.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # the app runs in this process: keep its in-memory cache
+    os.environ["WEB_CONCURRENCY"] = "1"
+    from sqlalchemy import select
+
+    import database
+    import main as app_module
+    import models
+
+    reset_schema(database.engine)
+    seed(
+        database.engine,
+        args.students,
+        num_users=max(100, args.students // 100),
+        num_courses=100,
+        workers=args.workers,
+    )
+    with database.engine.connect() as conn:
+        names = conn.scalars(select(models.Student.name).limit(1000)).all()
+        labs = conn.scalars(select(models.Student.lab).distinct()).all()
+        user_ids = conn.scalars(select(models.User.id)).all()
+        course_ids = conn.scalars(select(models.Course.id)).all()
+
+    async def run_all():
+        results = []
+        app = app_module.app
+        async with app.router.lifespan_context(app):
+            kinds = queries(
+                names, labs, user_ids, course_ids, random.Random(42)
+            )
+            for kind, make_params in kinds.items():
+                path = "/" + kind.split("?")[0]
+                await drive(app, path, make_params, 10)  # warm up
+                latencies = await drive(app, path, make_params, args.requests)
+                results.append(
+                    {"query": kind, "latency": summarize(latencies)}
+                )
+                print(results[-1])
+        return results
+
+    results = asyncio.run(run_all())
+    make_params = queries(names, labs, user_ids, course_ids, random.Random(42))
+    for kind in ("students?name", "students?name (no match)"):
+        latencies = scan_latencies(
+            database.engine, make_params[kind], args.requests
+        )
+        scan = {"query": f"{kind}, LIKE scan", "latency": summarize(latencies)}
+        print(scan)
+        results.append(scan)
+    save_results(
+        args.output,
+        "search",
+        {"students": args.students, "queries": results},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Startup time of the app: import-time breakdown and time to first request.
+
+`python -X importtime -c "import main"` is run in a fresh interpreter and
+the self time of every imported module is summed per top-level package, so
+a heavy import that sneaks into the startup path shows up by name. Then the
+app is started with uvicorn and the time from the process spawn to the
+first successful GET /courses (one real query on a SQLite file) is
+measured. Both are repeated and the medians are saved as JSON.
+
+    python -m benchmarks.startup --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.common import reset_schema, save_results
+from benchmarks.load_test import start_app
+
+
+def parse_importtime(stderr: str):
+    """Return (total ms of `import main`, self ms per top-level package)."""
+    per_package = defaultdict(float)
+    total = 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:") :].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:  # the header line
+            continue
+        name = fields[2].strip()
+        per_package[name.split(".")[0]] += self_us / 1000
+        if name == "main":
+            total = cumulative_us / 1000
+    return total, per_package
+
+
+def measure_imports(env: dict, top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total, per_package = parse_importtime(result.stderr)
+    heaviest = sorted(per_package.items(), key=lambda item: -item[1])[:top]
+    return total, {name: round(ms, 1) for name, ms in heaviest}
+
+
+def time_to_first_request(port: int, env: dict, timeout: float = 30):
+    import httpx
+
+    start = time.perf_counter()
+    app = start_app(port, env)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/courses")
+                if response.status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("the app did not start")
+    finally:
+        app.terminate()
+        app.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url", default="sqlite:///./bench_startup.db"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    from sqlalchemy import create_engine
+
+    engine = create_engine(args.database_url)
+    reset_schema(engine)
+    engine.dispose()
+    env = dict(os.environ)
+
+    import_totals, first_requests = [], []
+    packages = {}
+    for _ in range(args.repeat):
+        total, packages = measure_imports(env, args.top)
+        import_totals.append(total)
+        first_requests.append(time_to_first_request(args.port, env))
+
+    results = {
+        "import_main_ms": round(statistics.median(import_totals), 1),
+        "time_to_first_request_ms": round(
+            statistics.median(first_requests) * 1000, 1
+        ),
+        "heaviest_packages_ms": packages,
+        "repeat": args.repeat,
+    }
+    print(results)
+    save_results(args.output, "startup", results)
+
+
+if __name__ == "__main__":
+    main()
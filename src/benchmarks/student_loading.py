@@ -0,0 +1,116 @@
+"""
+Compare the loading strategies of /students (see crud.student_page).
+
+For every table size and strategy, a first page and a deep page (cursor in
+the middle of the table) are fetched repeatedly. The script reports the
+latency, the number of statements issued, and the rows and bytes returned
+by the database for one page.
+
+    python -m benchmarks.student_loading --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from benchmarks.common import reset_schema, save_results, seed, summarize
+
+
+def build_engine(url: str):
+    engine = create_engine(url)
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    return engine, statements
+
+
+def transferred(engine, statements):
+    """Replay the captured statements and measure what the database sends."""
+    rows = 0
+    size = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in statements:
+            cursor.execute(statement, parameters)
+            for row in cursor.fetchall():
+                rows += 1
+                size += sum(len(str(value)) for value in row)
+        cursor.close()
+    finally:
+        raw.close()
+    return rows, size
+
+
+def run_strategy(engine, statements, strategy, cursor, limit, repeat):
+    import crud
+    from database import SyncSessionAdapter
+
+    latencies = []
+    for _ in range(repeat):
+        statements.clear()
+        with Session(engine) as session:
+            db = SyncSessionAdapter(session)
+            start = time.perf_counter()
+            asyncio.run(crud.student_page(db, strategy, cursor, 0, limit))
+            latencies.append(time.perf_counter() - start)
+    captured = list(statements)
+    rows, size = transferred(engine, captured)
+    return {
+        "statements": len(captured),
+        "rows_fetched": rows,
+        "bytes_fetched": size,
+        "latency": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url", default="sqlite:///./bench_students.db"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--limit", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default="bench_student_loading.json")
+    args = parser.parse_args()
+
+    # the app modules build their engines from the environment at import
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["DB_MODE"] = "sync"
+    import crud
+    from pagination import encode_cursor
+
+    engine, statements = build_engine(args.database_url)
+    results = []
+    for size in args.sizes:
+        reset_schema(engine)
+        seed(engine, size)
+        pages = {"first": None, "deep": encode_cursor(size // 2)}
+        for strategy in crud.STUDENT_LOAD_STRATEGIES:
+            for page_name, cursor in pages.items():
+                result = run_strategy(
+                    engine,
+                    statements,
+                    strategy,
+                    cursor,
+                    args.limit,
+                    args.repeat,
+                )
+                result.update(students=size, strategy=strategy, page=page_name)
+                print(result)
+                results.append(result)
+    save_results(args.output, "student_loading", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import json
+import time
+from collections import OrderedDict
+
+import config
+
+# Read-through cache for data that changes rarely compared to how often it
+# is read: courses by id, pages of /courses and the role of a user.
+#
+# Two interchangeable backends share the same async interface:
+# - LRUCache: in-process, bounded, with a TTL per entry
+# - RedisCache: wraps any client with the redis.asyncio API (get, mget,
+#   set, delete, incr), e.g. redis.asyncio.Redis or a local stand-in such as
+#   fakeredis, so several workers can share entries and invalidations
+#
+# The in-process cache is only used when the app is known to run a single
+# process (config.SINGLE_PROCESS); several workers need the Redis one.
+#
+# Values must be JSON-serializable. Writers invalidate the keys they
+# affect, see invalidate_user and invalidate_courses.
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class LRUCache:
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stats = CacheStats()
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.entries[key]
+            self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def _store(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def get(self, key):
+        return self._lookup(key)
+
+    async def get_many(self, keys):
+        return [self._lookup(key) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self._store(key, value, ttl)
+
+    async def set_many(self, items: dict, ttl=None):
+        for key, value in items.items():
+            self._store(key, value, ttl)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def incr(self, key) -> int:
+        entry = self.entries.get(key)
+        value = (entry[0] if entry else 0) + 1
+        # counters never expire, they are only used as version numbers
+        self._store(key, value, ttl=0)
+        return value
+
+    async def clear(self):
+        self.entries.clear()
+
+
+class RedisCache:
+    name = "redis"
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "school:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def _count(self, value):
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(value)
+
+    async def get(self, key):
+        return self._count(await self.client.get(self.prefix + key))
+
+    async def get_many(self, keys):
+        if not keys:
+            return []
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return [self._count(value) for value in values]
+
+    async def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        await self.client.set(
+            self.prefix + key, json.dumps(value), ex=int(ttl) or None
+        )
+
+    async def set_many(self, items: dict, ttl=None):
+        for key, value in items.items():
+            await self.set(key, value, ttl)
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*[self.prefix + key for key in keys])
+
+    async def incr(self, key) -> int:
+        return await self.client.incr(self.prefix + key)
+
+
+class NullCache(LRUCache):
+    """Cache disabled: every lookup is a miss."""
+
+    name = "none"
+
+    def _store(self, key, value, ttl=None):
+        pass
+
+
+def build_cache():
+    if config.CACHE_BACKEND == "redis":
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis needs the redis package: pip install redis"
+            ) from None
+
+        client = redis.asyncio.Redis.from_url(config.REDIS_URL)
+        return RedisCache(client, ttl=config.CACHE_TTL)
+    # an in-process cache is only invalidated by the writes of its own
+    # process: with several workers, the others would keep authorizing a
+    # demoted or deleted user and accepting deleted courses until the TTL
+    if config.CACHE_BACKEND == "none" or not config.SINGLE_PROCESS:
+        return NullCache()
+    return LRUCache(max_entries=config.CACHE_MAX_ENTRIES, ttl=config.CACHE_TTL)
+
+
+cache = build_cache()
+
+
+class Generations:
+    """
+    Counters that are never evicted and not counted in the cache stats:
+    a plain dict in the process, or the Redis keys of the shared cache.
+    """
+
+    def __init__(self, backend):
+        self.client = getattr(backend, "client", None)
+        self.prefix = getattr(backend, "prefix", "")
+        self.local = {}
+
+    async def get(self, key) -> int:
+        if self.client is None:
+            return self.local.get(key, 0)
+        return int(await self.client.get(self.prefix + key) or 0)
+
+    async def incr(self, key) -> int:
+        if self.client is None:
+            self.local[key] = self.local.get(key, 0) + 1
+            return self.local[key]
+        return await self.client.incr(self.prefix + key)
+
+
+# kept apart from the LRU: an evicted generation would fall back to 0 and
+# bring back the pages cached under it
+generations = Generations(cache)
+
+
+# Keys
+
+
+def user_role_key(user_id: int) -> str:
+    return f"user:{user_id}:role"
+
+
+def course_key(course_id: int) -> str:
+    return f"course:{course_id}"
+
+
+COURSES_GENERATION_KEY = "courses:generation"
+
+
+async def course_page_key(cursor, skip: int, limit: int) -> str:
+    # every write on courses bumps the generation, which orphans all the
+    # cached pages at once (they then expire with their TTL)
+    generation = await generations.get(COURSES_GENERATION_KEY)
+    return f"courses:page:{generation}:{cursor}:{skip}:{limit}"
+
+
+# Invalidation
+
+
+async def invalidate_user(user_id: int):
+    await cache.delete(user_role_key(user_id))
+
+
+async def invalidate_courses(*course_ids: int):
+    await cache.delete(*[course_key(course_id) for course_id in course_ids])
+    await generations.incr(COURSES_GENERATION_KEY)
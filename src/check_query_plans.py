@@ -0,0 +1,88 @@
+"""
+Query-plan regression check for the hot queries of the API.
+
+Runs EXPLAIN on every query of HOT_QUERIES against DATABASE_URL (migrated
+with `alembic upgrade head`) and fails if the planner reads one of the
+tables with a full scan instead of an index.
+
+    python check_query_plans.py
+
+On Postgres sequential scans are disabled for the session, so the check
+does not depend on the number of rows: a Seq Scan in the plan then means
+that no usable index exists.
+"""
+
+import json
+import sys
+
+from sqlalchemy import create_engine, text
+
+import config
+
+HOT_QUERIES = {
+    "user by login": "SELECT id FROM users WHERE login = 'x'",
+    "user by id": "SELECT role FROM users WHERE id = 1",
+    "students of a user": "SELECT id FROM students WHERE user_id = 1",
+    "students page (keyset)": (
+        "SELECT id, name FROM students WHERE id > 1000 ORDER BY id LIMIT 15"
+    ),
+    "courses of students": (
+        "SELECT course_id FROM student_course WHERE student_id IN (1, 2, 3)"
+    ),
+    "students of a course": (
+        "SELECT student_id FROM student_course WHERE course_id = 1"
+    ),
+}
+
+
+def postgres_full_scans(conn, query: str):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(node.get("Relation Name"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return scans
+
+
+def sqlite_full_scans(conn, query: str):
+    # rows are (id, parent, notused, detail); "SCAN <table>" is a full scan,
+    # "SCAN <table> USING [COVERING ]INDEX" walks an index in order
+    scans = []
+    for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}")):
+        detail = row[3]
+        if detail.startswith("SCAN ") and "USING" not in detail:
+            scans.append(detail.split()[1])
+    return scans
+
+
+def check(url: str) -> bool:
+    engine = create_engine(url)
+    ok = True
+    with engine.connect() as conn:
+        dialect = engine.dialect.name
+        if dialect == "postgresql":
+            conn.execute(text("SET enable_seqscan = off"))
+            full_scans = postgres_full_scans
+        elif dialect == "sqlite":
+            full_scans = sqlite_full_scans
+        else:
+            print(f"unsupported dialect {dialect}")
+            return False
+        for name, query in HOT_QUERIES.items():
+            scans = full_scans(conn, query)
+            status = "FAIL" if scans else "ok"
+            detail = f" (full scan of {', '.join(scans)})" if scans else ""
+            print(f"{status:4} {name}{detail}")
+            ok = ok and not scans
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check(config.DATABASE_URL) else 1)
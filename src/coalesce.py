@@ -0,0 +1,125 @@
+import asyncio
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+import cache
+import config
+import routing
+from database import get_session
+
+# Single-flight for the list endpoints.
+#
+# Identical requests arriving while the first one is still being served
+# (the first page of /courses polled by hundreds of clients at once) share
+# its SQL queries and its serialized body instead of running their own: the
+# first request starts the work in a task and every identical request
+# awaits the same task.
+#
+# Two requests are identical when they have the same path and query
+# parameters, read the same side (replica or primary, see routing.py) and
+# see the same table versions (the ETag of versions.py, computed even when
+# it is not sent), so a request arriving after a write never joins a flight
+# that started before it.
+#
+# With COALESCE_TTL > 0 the result is also kept for that many seconds, a
+# micro-cache that absorbs bursts spread slightly over time; a write still
+# changes the ETag and therefore the key (with per-process versions, only
+# the writes of the same worker do, the others wait for the TTL).
+
+
+class SingleFlight:
+    def __init__(self, ttl: float = 0, max_entries: int = 1000):
+        self.inflight = {}
+        self.recent = (
+            cache.LRUCache(max_entries=max_entries, ttl=ttl) if ttl else None
+        )
+        self.leaders = 0
+        self.coalesced = 0
+        self.cached = 0
+
+    async def do(self, key: str, fn, keep: bool = True):
+        """
+        Return the result of `fn()`, shared with identical calls, and kept
+        in the micro-cache unless `keep` is false.
+        """
+        if self.recent is not None:
+            value = await self.recent.get(key)
+            if value is not None:
+                self.cached += 1
+                return value
+        task = self.inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(self._run(key, fn, keep))
+            # nobody may be left to retrieve the error of the task
+            task.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+            self.inflight[key] = task
+        else:
+            self.coalesced += 1
+        # a client disconnecting cancels its own request, not the task the
+        # other requests are waiting for
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fn, keep: bool):
+        try:
+            value = await fn()
+            if keep and self.recent is not None:
+                await self.recent.set(key, value)
+            return value
+        finally:
+            del self.inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cached": self.cached,
+            "inflight": len(self.inflight),
+        }
+
+
+single_flight = SingleFlight(
+    ttl=config.COALESCE_TTL, max_entries=config.COALESCE_MAX_ENTRIES
+)
+
+
+def request_key(request: Request, *parts) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return " ".join([request.url.path, query, *map(str, parts)])
+
+
+async def shared_response(
+    request: Request, response: Response, load
+) -> Response:
+    """
+    Serve a list request with `load(db)`, which returns the response built
+    from the rows, once for all the identical requests in flight.
+
+    versions.conditional_get must already have run for the request.
+    The shared work opens its own session, so it does not depend on the
+    request that started it.
+    """
+    replica = routing.use_replica(request)
+
+    async def render():
+        async with get_session(replica=replica) as db:
+            rendered = await load(db)
+        headers = {
+            key: value
+            for key, value in rendered.headers.items()
+            if key != "content-length"
+        }
+        return rendered.body, rendered.status_code, headers
+
+    if config.COALESCE_REQUESTS:
+        key = request_key(request, request.state.etag, replica)
+        # rows of a lagging replica are shared but not kept
+        body, status_code, headers = await single_flight.do(
+            key, render, keep=not request.state.replica_lagging
+        )
+    else:
+        body, status_code, headers = await render()
+    return Response(body, status_code=status_code, headers=headers)
@@ -0,0 +1,125 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import config
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, only gzip is offered without it
+    brotli = None
+
+# Response compression. Brotli is preferred when the client accepts it and
+# the brotli package is installed, gzip otherwise. Bodies smaller than
+# COMPRESSION_MIN_SIZE are sent as is, streamed bodies (the exports) are
+# compressed chunk by chunk and flushed after each chunk.
+
+
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(
+            level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        flush = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        return self.compressor.compress(data) + self.compressor.flush(flush)
+
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        body = self.compressor.process(data)
+        if last:
+            return body + self.compressor.finish()
+        return body + self.compressor.flush()
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Encodings of an Accept-Encoding header, without the refused (q=0)."""
+    encodings = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        encodings.add(name.strip())
+    return encodings
+
+
+def choose_compressor(accept_encoding: str, encodings):
+    accepted = accepted_encodings(accept_encoding)
+    if "br" in encodings and brotli is not None and "br" in accepted:
+        return BrotliCompressor(config.BROTLI_QUALITY)
+    if "gzip" in encodings and "gzip" in accepted:
+        return GzipCompressor(config.GZIP_LEVEL)
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 500, encodings=("br", "gzip")):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = {encoding.strip() for encoding in encodings}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        compressor = choose_compressor(accept_encoding, self.encodings)
+        if compressor is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        started = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough, started
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                # already encoded or without a body
+                encoded = "content-encoding" in headers
+                passthrough = encoded or message["status"] in (204, 304)
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not started:
+                started = True
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if len(body) < self.minimum_size and not more_body:
+                    await send(start)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = compressor.encoding
+                if more_body:
+                    del headers["Content-Length"]
+                body = compressor.compress(body, last=not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+            else:
+                body = compressor.compress(body, last=not more_body)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
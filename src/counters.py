@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import versions
+
+logger = logging.getLogger(__name__)
+
+# Precomputed counters behind /courses/stats and /users/{id}/stats:
+#   course_stats.students  number of students following each course
+#   user_stats.students    number of students of each user
+#
+# The student writes of crud.py add their deltas in their own transaction
+# (apply_deltas), so reading a counter is a primary-key lookup instead of a
+# count over student_course or students. reconcile() recomputes them from
+# scratch and fixes any drift, e.g. after rows written outside the API
+# (database_populate.py, manual SQL); the app runs it every
+# STATS_RECONCILE_INTERVAL seconds.
+
+COUNTER_TABLES = (
+    (models.CourseStats.__table__, "course_id"),
+    (models.UserStats.__table__, "user_id"),
+)
+
+
+async def upsert(db: AsyncSession, table, key: str, rows, increment: bool):
+    """
+    Write {key: ..., "students": n} rows, adding n to the current value
+    with `increment`, replacing it otherwise. Rows are written in key order
+    so that concurrent transactions lock the counters in the same order.
+    """
+    rows = sorted(rows, key=lambda row: row[key])
+    if not rows:
+        return
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name in ("postgresql", "sqlite"):
+        dialect = postgresql if dialect_name == "postgresql" else sqlite
+        stmt = dialect.insert(table)
+        students = stmt.excluded.students
+        if increment:
+            students = table.c.students + students
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c[key]], set_={"students": students}
+            ),
+            rows,
+        )
+        return
+    for row in rows:
+        students = row["students"]
+        if increment:
+            students = table.c.students + students
+        result = await db.execute(
+            update(table)
+            .where(table.c[key] == row[key])
+            .values(students=students)
+        )
+        if result.rowcount == 0:
+            await db.execute(table.insert().values(**row))
+
+
+async def apply_deltas(
+    db: AsyncSession, courses: Counter = None, users: Counter = None
+):
+    """Add the student count changes of a write, before its commit."""
+    for (table, key), deltas in zip(COUNTER_TABLES, (courses, users)):
+        rows = [
+            {key: id_, "students": delta}
+            for id_, delta in (deltas or {}).items()
+            if delta and id_ is not None
+        ]
+        await upsert(db, table, key, rows, increment=True)
+
+
+async def reconcile(db: AsyncSession) -> Dict[str, int]:
+    """
+    Recompute every counter, commit, and return the number of counters
+    corrected per table. A correction bumps the "students" version, so the
+    /stats responses validated before it are not answered with a 304.
+
+    On Postgres the counter tables are locked first (SHARE ROW EXCLUSIVE
+    conflicts with the row updates of apply_deltas): writers that already
+    updated a counter are waited for and included in the recount, the
+    others wait for the end of the reconciliation and apply their deltas on
+    top of it, so no concurrent update is lost.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(
+            text(
+                "LOCK TABLE course_stats, user_stats "
+                "IN SHARE ROW EXCLUSIVE MODE"
+            )
+        )
+    link = models.student_course
+    truths = (
+        select(link.c.course_id, func.count()).group_by(link.c.course_id),
+        select(models.Student.user_id, func.count())
+        .where(models.Student.user_id.is_not(None))
+        .group_by(models.Student.user_id),
+    )
+    fixed = {}
+    for (table, key), truth in zip(COUNTER_TABLES, truths):
+        expected = dict((await db.execute(truth)).all())
+        current = dict(
+            (await db.execute(select(table.c[key], table.c.students))).all()
+        )
+        wrong = [
+            {key: id_, "students": count}
+            for id_, count in expected.items()
+            if current.get(id_) != count
+        ]
+        stale = [
+            id_
+            for id_, count in current.items()
+            if id_ not in expected and count != 0
+        ]
+        await upsert(db, table, key, wrong, increment=False)
+        if stale:
+            await db.execute(delete(table).where(table.c[key].in_(stale)))
+        fixed[table.name] = len(wrong) + len(stale)
+    await db.commit()
+    if any(fixed.values()):
+        await versions.bump("students")
+    return fixed
+
+
+async def reconcile_periodically(session_factory, interval: float):
+    """Run reconcile every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                fixed = await reconcile(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("counter reconciliation failed")
+            continue
+        if any(fixed.values()):
+            logger.warning("counter reconciliation fixed %s", fixed)
+
+
+async def main():
+    import database
+
+    database.init_engines()
+    try:
+        async with database.get_session() as db:
+            print(await reconcile(db))
+    finally:
+        await database.dispose_engines()
+
+
+if __name__ == "__main__":
+    # one reconciliation, e.g. after loading data with database_populate.py
+    asyncio.run(main())
@@ -0,0 +1,718 @@
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import ARRAY, Integer, String, any_, bindparam, delete
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+import cache
+import counters
+import models
+import schema
+from pagination import Page, fetch_page
+from utils import hash_passwords_async
+
+# Set-based helpers used by the bulk endpoints: the whole batch is validated
+# with one query per referenced table, then written with multi-row
+# INSERT ... RETURNING statements inside a single transaction.
+#
+# Every helper returns (created, errors). `errors` holds one
+# schema.BulkItemError per rejected item (index in the submitted batch).
+# With atomic=True nothing is written as soon as one item is rejected,
+# otherwise the valid items are inserted and the others are reported.
+
+
+async def existing_ids(db: AsyncSession, column, ids) -> set:
+    """Return the subset of `ids` present in `column`, using one query."""
+    if not ids:
+        return set()
+    result = await db.scalars(select(column).where(column.in_(ids)))
+    return set(result.all())
+
+
+def id_in(db: AsyncSession, column, ids):
+    """
+    `column IN ids` as one bound parameter on Postgres (`= ANY(:ids)`), so
+    the statement text, and its cached plan, does not depend on len(ids).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return column == any_(
+            bindparam("ids", list(ids), type_=ARRAY(Integer))
+        )
+    return column.in_(ids)
+
+
+async def get_user_role(db: AsyncSession, user_id: int):
+    """
+    Return (exists, role) for a user, read through the cache. Callers that
+    change a role or delete a user must call cache.invalidate_user.
+    """
+    key = cache.user_role_key(user_id)
+    cached = await cache.cache.get(key)
+    if cached is not None:
+        return True, cached["role"]
+    result = await db.execute(
+        select(models.User.role).where(models.User.id == user_id)
+    )
+    row = result.first()
+    if row is None:
+        return False, None
+    await cache.cache.set(key, {"role": row.role})
+    return True, row.role
+
+
+async def existing_course_ids(db: AsyncSession, ids) -> set:
+    """Like existing_ids for courses, served from the cache when possible."""
+    ids = sorted(ids)
+    cached = await cache.cache.get_many([cache.course_key(i) for i in ids])
+    known = {i for i, course in zip(ids, cached) if course is not None}
+    missing = [i for i, course in zip(ids, cached) if course is None]
+    if missing:
+        result = await db.execute(
+            select(*COURSE_COLUMNS).where(models.Course.id.in_(missing))
+        )
+        found = {row.id: {"id": row.id, "title": row.title} for row in result}
+        await cache.cache.set_many(
+            {cache.course_key(i): course for i, course in found.items()}
+        )
+        known.update(found)
+    return known
+
+
+async def insert_returning(
+    db: AsyncSession, model, columns, rows: List[Dict]
+) -> List[Dict]:
+    """
+    Insert `rows` with one INSERT ... RETURNING `columns` (per batch of
+    parameters), and return the created rows in the order of `rows`.
+
+    Postgres orders the returned rows with sort_by_parameter_order. On
+    SQLite that option falls back to one INSERT per row, so the rows are
+    sorted by id instead: a multi-row INSERT assigns increasing ids in the
+    order of its VALUES.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        result = await db.execute(insert(model).returning(*columns), rows)
+        return sorted(
+            (dict(row._mapping) for row in result.all()),
+            key=lambda row: row["id"],
+        )
+    result = await db.execute(
+        insert(model).returning(*columns, sort_by_parameter_order=True), rows
+    )
+    return [dict(row._mapping) for row in result.all()]
+
+
+async def bulk_create_students(
+    db: AsyncSession,
+    students: List[schema.StudentCreate],
+    atomic: bool = False,
+    commit: bool = True,
+) -> Tuple[List[Dict], List[schema.BulkItemError]]:
+    """With commit=False the caller commits, e.g. with other writes."""
+    user_ids = {student.user_id for student in students}
+    course_ids = {
+        course_id
+        for student in students
+        for course_id in student.course_id or []
+    }
+    known_users = await existing_ids(db, models.User.id, user_ids)
+    known_courses = await existing_course_ids(db, course_ids)
+
+    errors = []
+    valid = []
+    for index, student in enumerate(students):
+        if student.user_id not in known_users:
+            errors.append(
+                schema.BulkItemError(index=index, detail="User not found")
+            )
+            continue
+        missing = sorted(set(student.course_id or []) - known_courses)
+        if missing:
+            errors.append(
+                schema.BulkItemError(
+                    index=index, detail=f"Some courses not found: {missing}"
+                )
+            )
+            continue
+        valid.append(student)
+
+    if (atomic and errors) or not valid:
+        return [], errors
+
+    created = await insert_returning(
+        db,
+        models.Student,
+        STUDENT_COLUMNS,
+        [
+            {
+                "name": student.name,
+                "lab": student.lab,
+                "user_id": student.user_id,
+            }
+            for student in valid
+        ],
+    )
+
+    links = [
+        {"student_id": row["id"], "course_id": course_id}
+        for row, student in zip(created, valid)
+        for course_id in sorted(set(student.course_id or []))
+    ]
+    if links:
+        await db.execute(insert(models.student_course), links)
+    await counters.apply_deltas(
+        db,
+        courses=Counter(link["course_id"] for link in links),
+        users=Counter(row["user_id"] for row in created),
+    )
+
+    if commit:
+        await db.commit()
+    return created, errors
+
+
+async def bulk_create_courses(
+    db: AsyncSession, courses: List[schema.CourseCreate], atomic: bool = False
+) -> Tuple[List[Dict], List[schema.BulkItemError]]:
+    errors = []
+    valid = []
+    for index, course in enumerate(courses):
+        if not course.title.strip():
+            errors.append(
+                schema.BulkItemError(index=index, detail="Empty title")
+            )
+            continue
+        valid.append(course)
+
+    if (atomic and errors) or not valid:
+        return [], errors
+
+    created = await insert_returning(
+        db,
+        models.Course,
+        COURSE_COLUMNS,
+        [{"title": course.title} for course in valid],
+    )
+    await db.commit()
+    return created, errors
+
+
+async def bulk_create_users(
+    db: AsyncSession, users: List[schema.UserCreate], atomic: bool = False
+) -> Tuple[List[Dict], List[schema.BulkItemError]]:
+    known_logins = await existing_ids(
+        db, models.User.login, {user.login for user in users}
+    )
+
+    errors = []
+    valid = []
+    seen = set()
+    for index, user in enumerate(users):
+        if user.login in known_logins or user.login in seen:
+            errors.append(
+                schema.BulkItemError(
+                    index=index, detail="Login already exists"
+                )
+            )
+            continue
+        seen.add(user.login)
+        valid.append(user)
+
+    if (atomic and errors) or not valid:
+        return [], errors
+
+    hashed = await hash_passwords_async([user.password for user in valid])
+    created = await insert_returning(
+        db,
+        models.User,
+        USER_COLUMNS,
+        [
+            {
+                "name": user.name,
+                "login": user.login,
+                "password": password,
+                "phone": user.phone,
+                "role": user.role,
+            }
+            for user, password in zip(valid, hashed)
+        ],
+    )
+    await db.commit()
+    return created, errors
+
+
+# Bulk update of students: the targets are loaded with one query, the
+# referenced courses validated with one query, name/lab written with a single
+# UPDATE ... FROM unnest(...) (an executemany UPDATE on other databases)
+# and the course memberships diffed against the current links, all in one
+# transaction. Only the fields given in an update are changed; course_id
+# replaces the whole set of courses of the student.
+
+
+async def bulk_update_students(
+    db: AsyncSession, updates: List[schema.StudentUpdate]
+) -> Tuple[List[Dict], List[schema.BulkItemError]]:
+    """Nothing is written when an item is rejected."""
+    ids = list(dict.fromkeys(item.id for item in updates))
+    result = await db.execute(
+        select(*STUDENT_COLUMNS).where(id_in(db, models.Student.id, ids))
+    )
+    students = {row["id"]: row for row in rows_as_dicts(result.all())}
+    known_courses = await existing_course_ids(
+        db,
+        {course_id for item in updates for course_id in item.course_id or []},
+    )
+
+    errors = []
+    courses = {}  # student id -> new set of course ids
+    for index, item in enumerate(updates):
+        student = students.get(item.id)
+        if student is None:
+            errors.append(
+                schema.BulkItemError(
+                    index=index, detail="can not found the student"
+                )
+            )
+            continue
+        if item.course_id is not None:
+            missing = sorted(set(item.course_id) - known_courses)
+            if missing:
+                errors.append(
+                    schema.BulkItemError(
+                        index=index,
+                        detail=f"Some courses not found: {missing}",
+                    )
+                )
+                continue
+            courses[item.id] = set(item.course_id)
+        # a student repeated in the batch gets the fields of every update
+        if item.name is not None:
+            student["name"] = item.name
+        if item.lab is not None:
+            student["lab"] = item.lab
+    if errors:
+        return [], errors
+
+    changed = {
+        item.id
+        for item in updates
+        if item.name is not None or item.lab is not None
+    }
+    rows = [
+        {"id": i, "name": students[i]["name"], "lab": students[i]["lab"]}
+        for i in ids
+        if i in changed
+    ]
+    if rows:
+        await update_names_and_labs(db, rows)
+    if courses:
+        deltas = await replace_student_courses(db, courses)
+        await counters.apply_deltas(db, courses=deltas)
+
+    await db.commit()
+    return [students[i] for i in ids], errors
+
+
+def unnest(name: str, columns: Dict[str, list], types: Dict[str, type]):
+    """
+    Postgres `unnest(:a, :b, ...) AS name(a, b, ...)`: one array parameter
+    per column whatever the number of rows, where a VALUES list binds one
+    parameter per cell and fails beyond 32767 of them.
+    """
+    return (
+        func.unnest(
+            *[
+                bindparam(column, values_, type_=ARRAY(types[column]))
+                for column, values_ in columns.items()
+            ]
+        )
+        .table_valued(*columns)
+        .render_derived(name=name)
+    )
+
+
+async def update_names_and_labs(db: AsyncSession, rows: List[Dict]):
+    table = models.Student.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        new = unnest(
+            "new",
+            {
+                "id": [row["id"] for row in rows],
+                "name": [row["name"] for row in rows],
+                "lab": [row["lab"] for row in rows],
+            },
+            {"id": Integer, "name": String, "lab": String},
+        )
+        await db.execute(
+            update(table)
+            .where(table.c.id == new.c.id)
+            .values(name=new.c.name, lab=new.c.lab)
+        )
+        return
+    await db.execute(
+        update(table)
+        .where(table.c.id == bindparam("student_id"))
+        .values(name=bindparam("new_name"), lab=bindparam("new_lab")),
+        [
+            {
+                "student_id": row["id"],
+                "new_name": row["name"],
+                "new_lab": row["lab"],
+            }
+            for row in rows
+        ],
+    )
+
+
+async def replace_student_courses(
+    db: AsyncSession, courses: Dict[int, set]
+) -> Counter:
+    """
+    Set-based diff of student_course against the wanted memberships.
+    Returns the change of the number of students of each course.
+    """
+    link = models.student_course
+    result = await db.execute(
+        select(link.c.student_id, link.c.course_id).where(
+            id_in(db, link.c.student_id, courses)
+        )
+    )
+    current = set(result.all())
+    wanted = {
+        (student_id, course_id)
+        for student_id, course_ids in courses.items()
+        for course_id in course_ids
+    }
+    removed = sorted(current - wanted)
+    added = sorted(wanted - current)
+    if removed and db.get_bind().dialect.name == "postgresql":
+        pairs = unnest(
+            "removed",
+            {
+                "student_id": [student_id for student_id, _ in removed],
+                "course_id": [course_id for _, course_id in removed],
+            },
+            {"student_id": Integer, "course_id": Integer},
+        )
+        await db.execute(
+            delete(link).where(
+                link.c.student_id == pairs.c.student_id,
+                link.c.course_id == pairs.c.course_id,
+            )
+        )
+    elif removed:
+        # two parameters per pair: batches stay below the 999 parameters of
+        # older SQLite versions
+        for start in range(0, len(removed), 400):
+            await db.execute(
+                delete(link).where(
+                    tuple_(link.c.student_id, link.c.course_id).in_(
+                        removed[start : start + 400]
+                    )
+                )
+            )
+    if added:
+        await db.execute(
+            insert(link),
+            [
+                {"student_id": student_id, "course_id": course_id}
+                for student_id, course_id in added
+            ],
+        )
+    deltas = Counter(course_id for _, course_id in added)
+    deltas.subtract(course_id for _, course_id in removed)
+    return deltas
+
+
+# Deletes are single `DELETE ... RETURNING id` statements: nothing is
+# loaded, the links in student_course are removed by ON DELETE CASCADE and
+# the students of a deleted user get a NULL user_id (ON DELETE SET NULL).
+
+
+async def delete_rows(db: AsyncSession, column, ids) -> Tuple[List, List]:
+    """Delete the rows whose `column` is in `ids`, return (deleted, missing)."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return [], []
+    result = await db.execute(
+        delete(column.table).where(id_in(db, column, ids)).returning(column)
+    )
+    deleted = set(result.scalars().all())
+    await db.commit()
+    return (
+        [i for i in ids if i in deleted],
+        [i for i in ids if i not in deleted],
+    )
+
+
+async def delete_students(db: AsyncSession, ids) -> Tuple[List, List]:
+    """
+    Like delete_rows, the links are deleted first (rather than by the
+    cascade) to know which counters of counters.py to decrement.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return [], []
+    link = models.student_course
+    result = await db.execute(
+        delete(link)
+        .where(id_in(db, link.c.student_id, ids))
+        .returning(link.c.course_id)
+    )
+    courses = Counter(result.scalars().all())
+    result = await db.execute(
+        delete(models.Student)
+        .where(id_in(db, models.Student.id, ids))
+        .returning(models.Student.id, models.Student.user_id)
+    )
+    rows = result.all()
+    users = Counter(row.user_id for row in rows)
+    await counters.apply_deltas(
+        db,
+        courses=Counter({i: -n for i, n in courses.items()}),
+        users=Counter({i: -n for i, n in users.items()}),
+    )
+    await db.commit()
+    deleted = {row.id for row in rows}
+    return (
+        [i for i in ids if i in deleted],
+        [i for i in ids if i not in deleted],
+    )
+
+
+async def delete_course(db: AsyncSession, course_id: int) -> bool:
+    deleted, _ = await delete_rows(db, models.Course.id, [course_id])
+    return bool(deleted)
+
+
+async def delete_user(db: AsyncSession, user_id: int) -> bool:
+    deleted, _ = await delete_rows(db, models.User.id, [user_id])
+    return bool(deleted)
+
+
+# Loading strategies for students with their courses.
+#
+# "joined":    legacy joinedload + LIMIT, wraps the page in a subquery and
+#              returns one row per (student, course) pair
+# "selectin":  one query for the page of students, one `IN (...)` query for
+#              their courses, no row explosion
+# "aggregate": one query, the courses of each student are aggregated into a
+#              JSON array by the database (json_agg on Postgres,
+#              json_group_array on SQLite) and no ORM object is built
+
+STUDENT_LOAD_STRATEGIES = ("joined", "selectin", "aggregate")
+
+
+def courses_json_column(dialect_name: str):
+    course = models.Course.__table__
+    link = models.student_course
+    if dialect_name == "postgresql":
+        agg = func.json_agg(
+            func.json_build_object("id", course.c.id, "title", course.c.title)
+        )
+    else:
+        agg = func.json_group_array(
+            func.json_object("id", course.c.id, "title", course.c.title)
+        )
+    return (
+        select(agg)
+        .select_from(link.join(course, course.c.id == link.c.course_id))
+        .where(link.c.student_id == models.Student.id)
+        .scalar_subquery()
+        .label("courses")
+    )
+
+
+def student_with_courses(row) -> Dict:
+    courses = row.courses
+    if isinstance(courses, str):
+        courses = json.loads(courses)
+    return {
+        "id": row.id,
+        "name": row.name,
+        "lab": row.lab,
+        "user_id": row.user_id,
+        "courses": sorted(courses or [], key=lambda course: course["id"]),
+    }
+
+
+async def student_page(
+    db: AsyncSession,
+    strategy: str = "selectin",
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 15,
+    filters=(),
+) -> Page:
+    """
+    Return a page of the students matching `filters` (see search.py) with
+    their courses using `strategy`.
+    """
+    dialect_name = db.get_bind().dialect.name
+    if strategy == "aggregate" and dialect_name in ("postgresql", "sqlite"):
+        stmt = select(
+            models.Student.id,
+            models.Student.name,
+            models.Student.lab,
+            models.Student.user_id,
+            courses_json_column(dialect_name),
+        ).where(*filters)
+        page = await fetch_page(
+            db, stmt, models.Student.id, cursor, skip, limit, scalars=False
+        )
+        page.rows = [student_with_courses(row) for row in page.rows]
+        return page
+
+    if strategy == "joined":
+        option = joinedload(models.Student.courses)
+    else:
+        option = selectinload(models.Student.courses)
+    stmt = select(models.Student).options(option).where(*filters)
+    return await fetch_page(db, stmt, models.Student.id, cursor, skip, limit)
+
+
+# Core read path: only the columns of the response are selected and the
+# rows are returned as plain dicts, without ORM identity map, instances or
+# Pydantic validation. Used when READ_PATH=core.
+
+USER_COLUMNS = (
+    models.User.id,
+    models.User.login,
+    models.User.password,
+    models.User.name,
+    models.User.phone,
+    models.User.role,
+)
+COURSE_COLUMNS = (models.Course.id, models.Course.title)
+STUDENT_COLUMNS = (
+    models.Student.id,
+    models.Student.name,
+    models.Student.lab,
+    models.Student.user_id,
+)
+
+
+def rows_as_dicts(rows) -> List[Dict]:
+    if not rows:
+        return []
+    keys = list(rows[0]._fields)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+async def user_rows_page(
+    db: AsyncSession, cursor=None, skip=0, limit=15, filters=()
+):
+    page = await fetch_page(
+        db,
+        select(*USER_COLUMNS).where(*filters),
+        models.User.id,
+        cursor,
+        skip,
+        limit,
+        False,
+    )
+    page.rows = rows_as_dicts(page.rows)
+    return page
+
+
+async def course_rows_page(db: AsyncSession, cursor=None, skip=0, limit=15):
+    """Page of courses, cached until the next write on courses."""
+    key = await cache.course_page_key(cursor, skip, limit)
+    cached = await cache.cache.get(key)
+    if cached is not None:
+        return Page(cached["rows"], cached["next"], cached["prev"])
+
+    page = await fetch_page(
+        db,
+        select(*COURSE_COLUMNS),
+        models.Course.id,
+        cursor,
+        skip,
+        limit,
+        False,
+    )
+    page.rows = rows_as_dicts(page.rows)
+    await cache.cache.set(
+        key,
+        {
+            "rows": page.rows,
+            "next": page.next_cursor,
+            "prev": page.prev_cursor,
+        },
+    )
+    return page
+
+
+async def student_rows_page(
+    db: AsyncSession,
+    strategy="selectin",
+    cursor=None,
+    skip=0,
+    limit=15,
+    filters=(),
+):
+    """Core version of student_page, the courses are fetched in one query."""
+    if strategy == "aggregate":
+        return await student_page(db, strategy, cursor, skip, limit, filters)
+
+    page = await fetch_page(
+        db,
+        select(*STUDENT_COLUMNS).where(*filters),
+        models.Student.id,
+        cursor,
+        skip,
+        limit,
+        False,
+    )
+    students = rows_as_dicts(page.rows)
+    by_id = {student["id"]: student for student in students}
+    for student in students:
+        student["courses"] = []
+    if by_id:
+        link = models.student_course
+        result = await db.execute(
+            select(link.c.student_id, *COURSE_COLUMNS)
+            .join(models.Course, models.Course.id == link.c.course_id)
+            .where(link.c.student_id.in_(by_id))
+            .order_by(link.c.student_id, models.Course.id)
+        )
+        for student_id, course_id, title in result.all():
+            by_id[student_id]["courses"].append(
+                {"id": course_id, "title": title}
+            )
+    page.rows = students
+    return page
+
+
+# Precomputed counters (see counters.py): one primary-key lookup per row
+# instead of a count over student_course or students.
+
+
+async def course_stats_page(db: AsyncSession, cursor=None, skip=0, limit=15):
+    stats = models.CourseStats
+    stmt = select(
+        *COURSE_COLUMNS, func.coalesce(stats.students, 0).label("students")
+    ).outerjoin(stats, stats.course_id == models.Course.id)
+    page = await fetch_page(
+        db, stmt, models.Course.id, cursor, skip, limit, False
+    )
+    page.rows = rows_as_dicts(page.rows)
+    return page
+
+
+async def user_stats(db: AsyncSession, user_id: int) -> Optional[Dict]:
+    """The counters of a user, None when the user does not exist."""
+    stats = models.UserStats
+    result = await db.execute(
+        select(
+            models.User.id.label("user_id"),
+            func.coalesce(stats.students, 0).label("students"),
+        )
+        .outerjoin(stats, stats.user_id == models.User.id)
+        .where(models.User.id == user_id)
+    )
+    row = result.first()
+    return dict(row._mapping) if row is not None else None
@@ -1,18 +1,72 @@
-from faker import Faker
+from sqlalchemy import create_engine, func, select, text
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Optional
-from database import Base, engine, SessionLocal
+import database
+from database import Base, DATABASE_URL
 from models import User, Student, Course, student_course
+import argparse
+import csv
+import io
 import logging
+import os
 import random
+import time
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Faker
-fake = Faker()
+
+def upgrade_schema(engine) -> None:
+    """Apply the Alembic migrations, as `alembic upgrade head` from src."""
+    from alembic import command
+    from alembic.config import Config
+
+    # no alembic.ini: its logging configuration would replace ours
+    alembic_config = Config()
+    alembic_config.set_main_option(
+        "script_location", os.path.join(os.path.dirname(__file__), "migrations")
+    )
+    with engine.begin() as connection:
+        alembic_config.attributes["connection"] = connection
+        command.upgrade(alembic_config, "head")
+
+
+def reconcile_counters(url: str) -> dict:
+    """
+    Fill the enrollment counters (course_stats, user_stats) from the rows
+    inserted without going through the API.
+    """
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    import config
+    import counters
+
+    async def run():
+        engine = create_async_engine(config.to_async_url(url))
+        try:
+            async with AsyncSession(engine) as session:
+                return await counters.reconcile(session)
+        finally:
+            await engine.dispose()
+
+    fixed = asyncio.run(run())
+    logger.info(f"Counters reconciled: {fixed}")
+    return fixed
+
+
+@lru_cache(maxsize=None)
+def get_faker():
+    """Faker is slow to import, it is only loaded when fake data is built."""
+    from faker import Faker
+
+    return Faker()
 
 
 def create_users(session: Session, num_users: int) -> List[User]:
@@ -26,6 +80,7 @@ def create_users(session: Session, num_users: int) -> List[User]:
     Returns:
         List[User]: List of created user objects
     """
+    fake = get_faker()
     users = []
     roles = ["admin", "user"]
     try:
@@ -59,6 +114,7 @@ def create_courses(session: Session, num_courses: int) -> List[Course]:
     Returns:
         List[Course]: List of created course objects
     """
+    fake = get_faker()
     courses = []
     try:
         for _ in range(num_courses):
@@ -89,13 +145,15 @@ def create_students(
     Returns:
         List[Student]: List of created student objects
     """
+    fake = get_faker()
     students = []
+    user_ids = [user.id for user in users]
     try:
         for _ in range(num_students):
             student = Student(
                 name=fake.name(),
                 lab=fake.word(),
-                user_id=fake.random_element([user.id for user in users]),
+                user_id=fake.random_element(user_ids),
             )
             # Randomly assign 1-3 courses to the student
             student.courses = fake.random_elements(
@@ -126,7 +184,7 @@ def create_fake_data(
     """
     try:
         # Ensure the database tables exist
-        Base.metadata.create_all(bind=engine)
+        upgrade_schema(database.engine)
 
         # Create the fake data in order
         users = create_users(session, num_users)
@@ -140,11 +198,243 @@ def create_fake_data(
         raise
 
 
-def main():
+# Bulk seeding mode (millions of rows)
+#
+# Faker is only used to build a small vocabulary once; the rows are then
+# drawn from it with a random.Random seeded per block of SEED_BLOCK student
+# ids, so the data only depends on --seed (not on the number of workers or
+# on --batch-size). Users and courses are
+# inserted first with explicit ids; the student id range is split in
+# batches loaded by a pool of worker processes, with COPY on Postgres
+# (psycopg2 or psycopg 3) and multi-row INSERTs on other databases.
+
+
+def build_vocabulary(seed: int, size: int = 2000) -> dict:
+    from faker import Faker
+
+    vocabulary_faker = Faker()
+    vocabulary_faker.seed_instance(seed)
+    return {
+        "names": [vocabulary_faker.name() for _ in range(size)],
+        "logins": [vocabulary_faker.user_name() for _ in range(size)],
+        "phones": [vocabulary_faker.phone_number() for _ in range(size)],
+        "titles": [vocabulary_faker.bs().title() for _ in range(size)],
+        "labs": [vocabulary_faker.word() for _ in range(size // 10)],
+    }
+
+
+def max_id(session: Session, model) -> int:
+    return session.scalar(select(func.coalesce(func.max(model.id), 0)))
+
+
+def copy_rows(engine, table: str, columns, rows) -> None:
+    """Load rows with COPY (Postgres) or a multi-row INSERT."""
+    if engine.dialect.name == "postgresql" and engine.dialect.driver in (
+        "psycopg2",
+        "psycopg",
+    ):
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            statement = (
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            )
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            if engine.dialect.driver == "psycopg2":
+                cursor.copy_expert(statement, buffer)
+            else:
+                with cursor.copy(statement) as copy:
+                    copy.write(buffer.getvalue())
+            raw.commit()
+        finally:
+            raw.close()
+        return
+
+    table_object = Base.metadata.tables[table]
+    with engine.begin() as conn:
+        conn.execute(
+            table_object.insert(),
+            [dict(zip(columns, row)) for row in rows],
+        )
+
+
+SEED_BLOCK = 1000
+
+
+def student_batch(start: int, stop: int, seed: int, vocabulary, user_ids, course_ids):
+    """Rows of students [start, stop) and their course links."""
+    students = []
+    links = []
+    max_courses = min(3, len(course_ids))
+    min_courses = min(1, max_courses)
+    for block in range(start - start % SEED_BLOCK, stop, SEED_BLOCK):
+        # the whole block is drawn, whatever the batch boundaries
+        rng = random.Random(f"{seed}:{block}")
+        names = rng.choices(vocabulary["names"], k=SEED_BLOCK)
+        labs = rng.choices(vocabulary["labs"], k=SEED_BLOCK)
+        owners = rng.choices(user_ids, k=SEED_BLOCK)
+        for offset, student_id in enumerate(range(block, block + SEED_BLOCK)):
+            courses = rng.sample(course_ids, rng.randint(min_courses, max_courses))
+            if start <= student_id < stop:
+                students.append(
+                    (student_id, names[offset], labs[offset], owners[offset])
+                )
+                for course_id in courses:
+                    links.append((student_id, course_id))
+    return students, links
+
+
+_worker = {}
+
+
+def init_worker(url: str, seed: int, vocabulary, user_ids, course_ids):
+    _worker["engine"] = create_engine(url, poolclass=NullPool)
+    _worker["args"] = (seed, vocabulary, user_ids, course_ids)
+
+
+def load_student_batch(bounds) -> int:
+    start, stop = bounds
+    engine = _worker["engine"]
+    students, links = student_batch(start, stop, *_worker["args"])
+    copy_rows(engine, "students", ("id", "name", "lab", "user_id"), students)
+    copy_rows(engine, "student_course", ("student_id", "course_id"), links)
+    return len(students) + len(links)
+
+
+def bulk_create_fake_data(
+    url: str,
+    num_users: int = 10,
+    num_courses: int = 5,
+    num_students: int = 20,
+    seed: int = 0,
+    workers: int = 1,
+    batch_size: int = 10000,
+    password: str = "password",
+) -> dict:
+    """
+    Seed the database in bulk and return the loading rates (rows/sec).
+    Every user gets the same bcrypt hash of `password`, computed once.
+    """
+    from utils import hash_password
+
+    bulk_engine = create_engine(url)
+    upgrade_schema(bulk_engine)
+    vocabulary = build_vocabulary(seed)
+    rng = random.Random(seed)
+    report = {}
+
+    with Session(bulk_engine) as session:
+        first_user = max_id(session, User) + 1
+        first_course = max_id(session, Course) + 1
+        first_student = max_id(session, Student) + 1
+
+    start = time.perf_counter()
+    hashed = hash_password(password)
+    user_ids = list(range(first_user, first_user + num_users))
+    copy_rows(
+        bulk_engine,
+        "users",
+        ("id", "name", "login", "password", "phone", "role"),
+        [
+            (
+                user_id,
+                rng.choice(vocabulary["names"]),
+                f"{rng.choice(vocabulary['logins'])}{user_id}",
+                hashed,
+                rng.choice(vocabulary["phones"]),
+                rng.choice(["admin", "user"]),
+            )
+            for user_id in user_ids
+        ],
+    )
+    course_ids = list(range(first_course, first_course + num_courses))
+    copy_rows(
+        bulk_engine,
+        "courses",
+        ("id", "title"),
+        [(course_id, rng.choice(vocabulary["titles"])) for course_id in course_ids],
+    )
+    elapsed = time.perf_counter() - start
+    report["users_and_courses_per_sec"] = round((num_users + num_courses) / elapsed, 1)
+
+    bounds = [
+        (low, min(low + batch_size, first_student + num_students))
+        for low in range(first_student, first_student + num_students, batch_size)
+    ]
+    start = time.perf_counter()
+    rows = 0
+    init_args = (url, seed, vocabulary, user_ids, course_ids)
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=init_args
+        ) as pool:
+            for loaded in pool.map(load_student_batch, bounds):
+                rows += loaded
+    else:
+        init_worker(*init_args)
+        for batch in bounds:
+            rows += load_student_batch(batch)
+    elapsed = time.perf_counter() - start
+    report["student_rows"] = rows
+    report["student_rows_per_sec"] = round(rows / elapsed, 1) if elapsed else 0
+
+    if bulk_engine.dialect.name == "postgresql":
+        # explicit ids were used, move the sequences past them
+        with bulk_engine.begin() as conn:
+            for table in ("users", "courses", "students"):
+                conn.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT coalesce(max(id), 1) FROM {table}))"
+                    )
+                )
+    bulk_engine.dispose()
+    reconcile_counters(url)
+    logger.info(f"Bulk seeding done: {report}")
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate fake school data.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument(
+        "--mode",
+        choices=["orm", "bulk"],
+        default="orm",
+        help="orm: one ORM object per row; bulk: COPY/multi-row batches",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main function to run the fake data generator."""
+    args = parse_args(argv)
     try:
-        with Session(engine) as session:
-            create_fake_data(session)
+        if args.mode == "bulk":
+            bulk_create_fake_data(
+                args.database_url,
+                args.users,
+                args.courses,
+                args.students,
+                seed=args.seed or 0,
+                workers=args.workers,
+                batch_size=args.batch_size,
+            )
+            return
+        if args.seed is not None:
+            get_faker().seed_instance(args.seed)
+            random.seed(args.seed)
+        with Session(database.engine) as session:
+            create_fake_data(session, args.users, args.courses, args.students)
+        reconcile_counters(DATABASE_URL)
     except Exception as e:
         logger.error(f"Failed to generate fake data: {str(e)}")
         raise
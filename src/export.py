@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from typing import Optional
+
+from sqlalchemy import select
+
+import models
+from database import stream_partitions
+from responses import dumps
+
+# Streaming export of the students with their courses. The rows of
+# students LEFT JOIN student_course LEFT JOIN courses are read ordered by
+# student id through a server-side cursor, consecutive rows of the same
+# student are merged, and every student is written out as soon as it is
+# complete, so memory stays constant whatever the size of the table.
+
+# course_ids are joined by ";" (as jobs.csv_rows reads them back) and
+# course_titles, which may contain ";" themselves, are a JSON array
+CSV_FIELDS = ["id", "name", "lab", "user_id", "course_ids", "course_titles"]
+
+
+def export_statement(
+    lab: Optional[str] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+):
+    link = models.student_course
+    stmt = (
+        select(
+            models.Student.id,
+            models.Student.name,
+            models.Student.lab,
+            models.Student.user_id,
+            models.Course.id.label("course_id"),
+            models.Course.title,
+        )
+        .outerjoin(link, link.c.student_id == models.Student.id)
+        .outerjoin(models.Course, models.Course.id == link.c.course_id)
+        .order_by(models.Student.id, models.Course.id)
+    )
+    if lab is not None:
+        stmt = stmt.where(models.Student.lab == lab)
+    if user_id is not None:
+        stmt = stmt.where(models.Student.user_id == user_id)
+    if course_id is not None:
+        # keep every course of the matching students, not only this one
+        stmt = stmt.where(
+            models.Student.id.in_(
+                select(link.c.student_id).where(link.c.course_id == course_id)
+            )
+        )
+    return stmt
+
+
+async def iter_students(
+    statement, batch_size: int = 1000, replica: bool = False
+):
+    """Yield one dict per student, with the list of its courses."""
+    current = None
+    async for partition in stream_partitions(statement, batch_size, replica):
+        for row in partition:
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    yield current
+                current = {
+                    "id": row.id,
+                    "name": row.name,
+                    "lab": row.lab,
+                    "user_id": row.user_id,
+                    "courses": [],
+                }
+            if row.course_id is not None:
+                current["courses"].append(
+                    {"id": row.course_id, "title": row.title}
+                )
+    if current is not None:
+        yield current
+
+
+async def ndjson_lines(
+    statement, batch_size: int = 1000, replica: bool = False
+):
+    async for student in iter_students(statement, batch_size, replica):
+        yield dumps(student) + b"\n"
+
+
+async def csv_lines(statement, batch_size: int = 1000, replica: bool = False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    async for student in iter_students(statement, batch_size, replica):
+        courses = student["courses"]
+        writer.writerow(
+            [
+                student["id"],
+                student["name"],
+                student["lab"],
+                student["user_id"],
+                ";".join(str(course["id"]) for course in courses),
+                json.dumps(
+                    [course["title"] for course in courses],
+                    ensure_ascii=False,
+                ),
+            ]
+        )
+        # flush by chunks of a few KB rather than one write per student
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Optional
+
+from sqlalchemy import text
+
+import config
+from database import get_session, pool_metrics
+
+# Probes for process managers and load balancers.
+#
+# liveness:  the event loop of the worker answers, no I/O
+# readiness: a connection can be checked out of the pool and runs
+#            SELECT 1 within HEALTH_CHECK_TIMEOUT, and the pool is not
+#            exhausted with requests already waiting for a connection
+
+
+async def check_database(timeout: float) -> Optional[str]:
+    """Return None when the database answers in time, else the error."""
+
+    async def ping():
+        async with get_session() as db:
+            await db.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.wait_for(ping(), timeout)
+    except asyncio.TimeoutError:
+        return f"no answer within {timeout}s"
+    except Exception as e:
+        return str(e) or type(e).__name__
+    return None
+
+
+def pool_exhausted(metrics: dict) -> bool:
+    if "checked_out" not in metrics:  # NullPool, e.g. behind PgBouncer
+        return False
+    capacity = config.DB_POOL_SIZE + max(config.DB_MAX_OVERFLOW, 0)
+    return metrics["checked_out"] >= capacity and metrics["waiting"] > 0
+
+
+async def readiness() -> dict:
+    metrics = pool_metrics()
+    error = await check_database(config.HEALTH_CHECK_TIMEOUT)
+    if error is None and pool_exhausted(metrics):
+        error = "connection pool exhausted"
+    return {
+        "status": "ok" if error is None else "unavailable",
+        "error": error,
+        "pool": metrics,
+    }
@@ -0,0 +1,188 @@
+import logging
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+# Per-request SQL instrumentation.
+#
+# SQLAlchemy cursor events (registered on every Engine, sync or behind an
+# AsyncEngine) add each statement to the RequestStats of the current
+# request, found through a context variable set by QueryStatsMiddleware.
+# The middleware then reports the statement count, total DB time and
+# slowest statement in a Server-Timing header, flags statements repeated
+# in a loop (N+1 pattern) and aggregates everything for /metrics.
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request issues too many statements."""
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.patterns = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.statements += 1
+        self.db_time += duration
+        self.patterns[statement] += 1
+        if duration > self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+
+    def repeated(self, threshold: int):
+        """Statements issued at least `threshold` times (N+1 candidates)."""
+        return {
+            statement: count
+            for statement, count in self.patterns.items()
+            if count >= threshold
+        }
+
+
+current_stats: ContextVar = ContextVar("current_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    budget = config.QUERY_BUDGET
+    if config.QUERY_BUDGET_STRICT and budget and stats.statements >= budget:
+        raise QueryBudgetExceeded(
+            f"query budget of {budget} statements exceeded"
+        )
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = current_stats.get()
+    starts = conn.info.get("query_start")
+    if stats is None or not starts:
+        return
+    stats.record(statement, time.perf_counter() - starts.pop())
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = Counter()  # (method, path, status)
+        self.duration = defaultdict(float)  # path
+        self.statements = Counter()  # path
+        self.db_time = defaultdict(float)  # path
+        self.n_plus_one = Counter()  # path
+
+    def observe(self, method, path, status, duration, stats: RequestStats):
+        self.requests[(method, path, status)] += 1
+        self.duration[path] += duration
+        self.statements[path] += stats.statements
+        self.db_time[path] += stats.db_time
+        if stats.repeated(config.N_PLUS_ONE_THRESHOLD):
+            self.n_plus_one[path] += 1
+
+
+route_metrics = RouteMetrics()
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware, so the context variable reaches the handler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            route_metrics.observe(
+                scope["method"],
+                path,
+                status,
+                time.perf_counter() - start,
+                stats,
+            )
+            budget = config.QUERY_BUDGET
+            if budget and stats.statements > budget:
+                logger.warning(
+                    "%s %s issued %d statements (budget %d)",
+                    scope["method"],
+                    path,
+                    stats.statements,
+                    budget,
+                )
+            repeated = stats.repeated(config.N_PLUS_ONE_THRESHOLD)
+            if repeated:
+                logger.warning(
+                    "possible N+1 on %s %s: %s",
+                    scope["method"],
+                    path,
+                    {sql[:120]: count for sql, count in repeated.items()},
+                )
+
+
+def server_timing(stats: RequestStats) -> bytes:
+    value = (
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.statements} queries", '
+        f"db-slowest;dur={stats.slowest * 1000:.2f}"
+    )
+    return value.encode()
+
+
+def prometheus_metrics(extra_gauges: dict) -> str:
+    """Render the route metrics and `extra_gauges` in Prometheus text format."""
+    lines = [
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, path, status), count in sorted(
+        route_metrics.requests.items()
+    ):
+        lines.append(
+            f'http_requests_total{{method="{method}",path="{path}",'
+            f'status="{status}"}} {count}'
+        )
+    per_path = (
+        ("http_request_duration_seconds_total", route_metrics.duration),
+        ("db_statements_total", route_metrics.statements),
+        ("db_time_seconds_total", route_metrics.db_time),
+        ("db_n_plus_one_requests_total", route_metrics.n_plus_one),
+    )
+    for name, values in per_path:
+        lines.append(f"# TYPE {name} counter")
+        for path, value in sorted(values.items()):
+            lines.append(f'{name}{{path="{path}"}} {value}')
+    for name, value in extra_gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
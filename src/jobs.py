@@ -0,0 +1,561 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import tempfile
+import time
+import uuid
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import func, insert, not_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+import crud
+import models
+import schema
+import versions
+from database import get_session
+
+logger = logging.getLogger(__name__)
+
+# Background imports.
+#
+# POST /create_students/jobs stores the submitted rows, unvalidated, in
+# chunks of IMPORT_CHUNK_SIZE rows (import_job_chunks) and returns the id
+# of the job (import_jobs) at once. IMPORT_WORKERS tasks per process poll
+# the chunks still to process, oldest first: a chunk is claimed for
+# IMPORT_LEASE seconds (FOR UPDATE SKIP LOCKED on Postgres, so the workers
+# of every process share the queue), its rows are validated and inserted
+# with crud.bulk_create_students, and the chunk is marked done in the same
+# transaction as the inserted rows. A chunk is therefore imported exactly
+# once: the chunk of a worker that died is taken over when its lease
+# expires, and a worker that finds its lease taken over rolls back.
+#
+# GET /jobs/{id} reports the progress, the throughput and the per-row
+# errors, read back from the chunks.
+
+JOBS = models.ImportJob.__table__
+CHUNKS = models.ImportJobChunk.__table__
+
+# key of a row that could not even be parsed
+PARSE_ERROR = "_error"
+# longest element of a JSON array looked for before the upload is rejected
+JSON_ROW_MAX_SIZE = 1024 * 1024
+
+CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+SUFFIXES = {
+    ".json": "json",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+}
+
+
+# Parsing of the submitted rows
+
+
+def csv_rows(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Rows of a CSV file with a header line: name, lab, user_id and the
+    course ids separated by ";" in course_id (or course_ids, so a CSV
+    export can be imported back).
+    """
+    for record in csv.DictReader(lines):
+        course_ids = record.get("course_id", record.get("course_ids")) or ""
+        yield {
+            "name": record.get("name"),
+            "lab": record.get("lab"),
+            "user_id": record.get("user_id") or None,
+            "course_id": [i for i in course_ids.split(";") if i.strip()],
+        }
+
+
+def from_export(row):
+    # the NDJSON export lists {"id", "title"} courses instead of course_id
+    if (
+        isinstance(row, dict)
+        and "course_id" not in row
+        and isinstance(row.get("courses"), list)
+    ):
+        courses = row["courses"]
+        row = {
+            **row,
+            "course_id": [
+                course.get("id") if isinstance(course, dict) else course
+                for course in courses
+            ],
+        }
+    return row
+
+
+def ndjson_rows(lines: Iterable[str]) -> Iterator[Dict]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {PARSE_ERROR: f"invalid JSON: {e}"}
+            continue
+        yield from_export(row)
+
+
+def invalid_json(detail) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"invalid JSON: {detail}")
+
+
+def json_rows(text, read_size: int = 64 * 1024) -> Iterator[Dict]:
+    """
+    The rows of a JSON array, or of a single JSON object, decoded one
+    element at a time while the file is read: only the element being
+    decoded and the last `read_size` characters read are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def read():
+        nonlocal buffer, position, eof
+        data = text.read(read_size)
+        buffer, position, eof = buffer[position:] + data, 0, not data
+
+    def next_char() -> str:
+        # the next character that is not whitespace, "" at the end
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position : position + 1]
+            read()
+
+    def next_value():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if eof:
+                    raise invalid_json(e.msg)
+                if len(buffer) - position > JSON_ROW_MAX_SIZE:
+                    raise invalid_json(
+                        f"element larger than {JSON_ROW_MAX_SIZE} characters"
+                    )
+                read()
+                continue
+            if end == len(buffer) and not eof:
+                # a number may go on in the next read
+                read()
+                continue
+            position = end
+            return value
+
+    if next_char() != "[":
+        value = next_value()
+        if next_char():
+            raise invalid_json("extra data after the value")
+        if not isinstance(value, dict):
+            raise HTTPException(
+                status_code=422, detail="expected a list of students"
+            )
+        yield from_export(value)
+        return
+    position += 1
+    if next_char() == "]":
+        position += 1
+    else:
+        while True:
+            next_char()
+            yield from_export(next_value())
+            separator = next_char()
+            position += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise invalid_json("expected ',' or ']' after an element")
+    if next_char():
+        raise invalid_json("extra data after the array")
+
+
+def detect_format(content_type: Optional[str], filename: Optional[str]):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    for suffix, format in SUFFIXES.items():
+        if (filename or "").lower().endswith(suffix):
+            return format
+    return None
+
+
+async def read_rows(request: Request) -> Iterator[Dict]:
+    """
+    The rows of a JSON, NDJSON or CSV body, or of a multipart upload in the
+    field `file`. The body is spooled to a temporary file (in memory while
+    small) instead of being held as one string, and the rows are parsed
+    lazily while the caller iterates over them.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(
+                status_code=422, detail="missing upload in the field 'file'"
+            )
+        format = detect_format(upload.content_type, upload.filename)
+        body = upload.file
+    else:
+        format = detect_format(content_type, None)
+        body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        async for data in request.stream():
+            body.write(data)
+    if format is None:
+        raise HTTPException(
+            status_code=415,
+            detail="send JSON, NDJSON (application/x-ndjson) "
+            "or CSV (text/csv)",
+        )
+    body.seek(0)
+    text = io.TextIOWrapper(body, encoding="utf-8", newline="")
+    if format == "json":
+        return json_rows(text)
+    if format == "ndjson":
+        return ndjson_rows(text)
+    return csv_rows(text)
+
+
+def validate_students(rows: List, first_row: int):
+    """Return (valid students, their row indexes, errors of the others)."""
+    students, indexes, errors = [], [], []
+    for index, row in enumerate(rows, start=first_row):
+        if isinstance(row, dict) and PARSE_ERROR in row:
+            errors.append({"index": index, "detail": row[PARSE_ERROR]})
+            continue
+        try:
+            students.append(schema.StudentCreate.model_validate(row))
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'row'}: "
+                f"{error['msg']}"
+                for error in e.errors()
+            )
+            errors.append({"index": index, "detail": detail})
+            continue
+        indexes.append(index)
+    return students, indexes, errors
+
+
+# Jobs
+
+
+async def create_job(
+    db: AsyncSession, kind: str, rows: Iterator, created_by: int
+) -> Dict:
+    """Store the rows of a new job in chunks, return its status."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    await db.execute(
+        insert(JOBS).values(
+            id=job_id,
+            kind=kind,
+            status="queued",
+            created_by=created_by,
+            total=0,
+            processed=0,
+            created=0,
+            failed=0,
+            created_at=now,
+        )
+    )
+    total = 0
+    rows = iter(rows)
+    while True:
+        try:
+            chunk = list(islice(rows, config.IMPORT_CHUNK_SIZE))
+        except HTTPException:
+            # a JSON upload found invalid halfway
+            await db.rollback()
+            raise
+        except (UnicodeDecodeError, csv.Error) as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=400, detail=f"unreadable file: {e}"
+            )
+        if not chunk:
+            break
+        await db.execute(
+            insert(CHUNKS).values(
+                job_id=job_id,
+                first_row=total,
+                size=len(chunk),
+                rows=chunk,
+                done=False,
+                attempts=0,
+            )
+        )
+        total += len(chunk)
+    values = {"total": total}
+    if total == 0:
+        values.update(status="done", started_at=now, finished_at=now)
+    await db.execute(update(JOBS).where(JOBS.c.id == job_id).values(values))
+    await db.commit()
+    import_workers.notify()
+    return await job_status(db, job_id, errors_limit=0)
+
+
+async def job_status(
+    db: AsyncSession, job_id: str, errors_limit: int = 100
+) -> Optional[Dict]:
+    result = await db.execute(select(JOBS).where(JOBS.c.id == job_id))
+    row = result.first()
+    if row is None:
+        return None
+    job = dict(row._mapping)
+    del job["created_by"]
+    job["progress"] = job["processed"] / job["total"] if job["total"] else 1.0
+    job["rows_per_sec"] = None
+    if job["started_at"] is not None:
+        elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+        if elapsed > 0:
+            job["rows_per_sec"] = round(job["processed"] / elapsed, 1)
+
+    errors = []
+    if errors_limit > 0 and job["failed"]:
+        # every chunk read holds at least one error
+        result = await db.execute(
+            select(CHUNKS.c.errors)
+            .where(CHUNKS.c.job_id == job_id, CHUNKS.c.errors.is_not(None))
+            .order_by(CHUNKS.c.first_row)
+            .limit(errors_limit)
+        )
+        for chunk_errors in result.scalars():
+            errors.extend(chunk_errors)
+    job["errors"] = errors[:errors_limit]
+    return job
+
+
+async def claim_chunk(token: str):
+    """Lease the oldest chunk to process, None when there is none."""
+    now = time.time()
+    pending = (
+        select(CHUNKS.c.id)
+        .where(
+            not_(CHUNKS.c.done),
+            or_(CHUNKS.c.lease_until.is_(None), CHUNKS.c.lease_until < now),
+        )
+        .order_by(CHUNKS.c.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with get_session() as db:
+        result = await db.execute(
+            update(CHUNKS)
+            .where(CHUNKS.c.id == pending)
+            .values(
+                claim=token,
+                lease_until=now + config.IMPORT_LEASE,
+                attempts=CHUNKS.c.attempts + 1,
+            )
+            .returning(
+                CHUNKS.c.id,
+                CHUNKS.c.job_id,
+                CHUNKS.c.first_row,
+                CHUNKS.c.size,
+                CHUNKS.c.rows,
+                CHUNKS.c.attempts,
+            )
+        )
+        chunk = result.first()
+        if chunk is not None:
+            await db.execute(
+                update(JOBS)
+                .where(JOBS.c.id == chunk.job_id, JOBS.c.status == "queued")
+                .values(status="running", started_at=now)
+            )
+        await db.commit()
+    return chunk
+
+
+async def finish_chunk(
+    db: AsyncSession, chunk, token: str, created: int, errors: List[Dict]
+) -> bool:
+    """
+    Mark the chunk done and update its job, in the transaction of the
+    inserted rows. False when the lease was lost: the caller rolls back.
+    """
+    result = await db.execute(
+        update(CHUNKS)
+        .where(
+            CHUNKS.c.id == chunk.id,
+            CHUNKS.c.claim == token,
+            not_(CHUNKS.c.done),
+        )
+        .values(
+            done=True,
+            rows=None,
+            errors=sorted(errors, key=lambda e: e["index"]) or None,
+            claim=None,
+            lease_until=None,
+        )
+    )
+    if result.rowcount != 1:
+        return False
+    # the job row is updated before counting the remaining chunks: the
+    # last two chunks of a job finishing together are serialized on it
+    await db.execute(
+        update(JOBS)
+        .where(JOBS.c.id == chunk.job_id)
+        .values(
+            processed=JOBS.c.processed + chunk.size,
+            created=JOBS.c.created + created,
+            failed=JOBS.c.failed + len(errors),
+        )
+    )
+    remaining = await db.scalar(
+        select(func.count())
+        .select_from(CHUNKS)
+        .where(CHUNKS.c.job_id == chunk.job_id, not_(CHUNKS.c.done))
+    )
+    if remaining == 0:
+        await db.execute(
+            update(JOBS)
+            .where(JOBS.c.id == chunk.job_id)
+            .values(status="done", finished_at=time.time())
+        )
+    return True
+
+
+async def process_chunk(chunk, token: str) -> int:
+    """Import the rows of a claimed chunk, return the number created."""
+    students, indexes, errors = validate_students(chunk.rows, chunk.first_row)
+    async with get_session() as db:
+        created = []
+        if students:
+            created, rejected = await crud.bulk_create_students(
+                db, students, commit=False
+            )
+            errors += [
+                {"index": indexes[error.index], "detail": error.detail}
+                for error in rejected
+            ]
+        if not await finish_chunk(db, chunk, token, len(created), errors):
+            await db.rollback()
+            logger.warning("lease of import chunk %s lost", chunk.id)
+            return 0
+        await db.commit()
+    if created:
+        await versions.bump("students")
+    return len(created)
+
+
+async def fail_chunk(chunk, token: str, message: str):
+    """
+    Release a chunk whose import raised, so it is retried, or after
+    IMPORT_MAX_ATTEMPTS report all its rows as errors.
+    """
+    async with get_session() as db:
+        if chunk.attempts >= config.IMPORT_MAX_ATTEMPTS:
+            errors = [
+                {"index": index, "detail": f"import failed: {message}"}
+                for index in range(
+                    chunk.first_row, chunk.first_row + chunk.size
+                )
+            ]
+            await finish_chunk(db, chunk, token, 0, errors)
+        else:
+            await db.execute(
+                update(CHUNKS)
+                .where(CHUNKS.c.id == chunk.id, CHUNKS.c.claim == token)
+                .values(claim=None, lease_until=None)
+            )
+        await db.commit()
+
+
+class ImportWorkers:
+    """The import worker tasks of this process."""
+
+    def __init__(self):
+        self.tasks = []
+        self.stopping = False
+        self.wakeup = None
+        self.busy = 0
+        self.chunks = 0
+        self.rows = 0
+        self.failures = 0
+
+    def start(self, count: int):
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(count)]
+
+    def notify(self):
+        """Wake the idle workers, e.g. when a job was just created."""
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def stop(self, timeout: float):
+        """Let the chunks in progress finish, for up to `timeout` seconds."""
+        if not self.tasks:
+            return
+        self.stopping = True
+        self.notify()
+        _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.tasks = []
+
+    async def run(self):
+        while not self.stopping:
+            token = uuid.uuid4().hex
+            try:
+                chunk = await claim_chunk(token)
+            except Exception:
+                logger.exception("could not claim an import chunk")
+                chunk = None
+            if chunk is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self.wakeup.wait(), config.IMPORT_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.busy += 1
+            try:
+                await process_chunk(chunk, token)
+                self.chunks += 1
+                self.rows += chunk.size
+            except Exception as e:
+                logger.exception("import chunk %s failed", chunk.id)
+                self.failures += 1
+                try:
+                    await fail_chunk(chunk, token, str(e) or type(e).__name__)
+                except Exception:
+                    logger.exception("could not release chunk %s", chunk.id)
+            finally:
+                self.busy -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.tasks),
+            "busy": self.busy,
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "failures": self.failures,
+        }
+
+
+import_workers = ImportWorkers()
@@ -1,46 +1,225 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Union, Dict
-
-
-from database import Base, engine, SessionLocal
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Union, Dict
+
+
+from compression import CompressionMiddleware
+from jobs import import_workers
+from database import get_session, pool_metrics
+import database
+import auth
+import cache
+import coalesce
+import config
+import counters
+import crud
+import export
+import health
+import instrumentation
+import jobs
 import models
+import payloads
+import routing
 import schema
-from utils import hash_password, verify_password
+import search
+import versions
+from pagination import paginate, set_page_headers
+from responses import FastJSONResponse, bulk_response, list_response
+from utils import (
+    PasswordPoolBusy,
+    hash_password_async,
+    password_hasher,
+    verify_and_update_password_async,
+)
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # nothing touches the database at import time: the engine is built (and
+    # the schema created when DB_CREATE_SCHEMA is set) when the app starts
+    database.init_engines()
+    if config.DB_CREATE_SCHEMA:
+        await database.create_schema()
+    reconciler = None
+    if config.STATS_RECONCILE_INTERVAL > 0:
+        reconciler = asyncio.create_task(
+            counters.reconcile_periodically(
+                get_session, config.STATS_RECONCILE_INTERVAL
+            )
+        )
+    import_workers.start(config.IMPORT_WORKERS)
+    yield
+    # the chunks being imported are finished, the others wait in the table
+    await import_workers.stop(config.SHUTDOWN_TIMEOUT)
+    if reconciler is not None:
+        reconciler.cancel()
+        with suppress(asyncio.CancelledError):
+            await reconciler
+    password_hasher.shutdown()
+    await database.dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(instrumentation.QueryStatsMiddleware)
+if database.has_replica():
+    app.add_middleware(
+        routing.ReadYourWritesMiddleware,
+        window=config.READ_YOUR_WRITES_WINDOW,
+    )
+if config.COMPRESSION != "none":
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=config.COMPRESSION_MIN_SIZE,
+        encodings=config.COMPRESSION.split(","),
+    )
 
-Base.metadata.create_all(bind=engine)
+# the schema is managed by the Alembic migrations (alembic upgrade head),
+# see DB_CREATE_SCHEMA for tests
 
 
 # define the dependence
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    # AsyncSession by default, blocking Session adapter when DB_MODE=sync
+    async with get_session() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def get_read_db(request: Request):
+    # read-only handlers: the replica when there is one, unless the client
+    # has written within READ_YOUR_WRITES_WINDOW (see routing.py)
+    async with get_session(replica=routing.use_replica(request)) as db:
+        yield db
+
+
+@app.exception_handler(PasswordPoolBusy)
+async def password_pool_busy_handler(request: Request, exc: PasswordPoolBusy):
+    # only the password endpoints are slowed down by a hashing storm
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "too many password operations, retry later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.get("/metrics/pool")
+async def get_pool_metrics() -> Dict[str, Union[str, bool, int, float]]:
+    return pool_metrics()
+
+
+@app.get("/metrics/cache")
+async def get_cache_metrics() -> Dict[str, Union[str, int]]:
+    return {"backend": cache.cache.name, **cache.cache.stats.as_dict()}
+
+
+@app.get("/metrics/coalescing")
+async def get_coalescing_metrics() -> Dict[str, int]:
+    return coalesce.single_flight.stats()
+
+
+@app.get("/metrics/password_hashing")
+async def get_password_hashing_metrics() -> Dict[str, Union[str, int]]:
+    return password_hasher.stats()
+
+
+@app.get("/health/live")
+async def liveness() -> Dict[str, str]:
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def get_readiness():
+    report = await health.readiness()
+    status_code = 200 if report["error"] is None else 503
+    return JSONResponse(status_code=status_code, content=report)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    # Prometheus text format: per-route requests and SQL statistics plus
+    # the pool, cache and password hashing gauges
+    gauges = {}
+    for prefix, values in (
+        ("db_pool", pool_metrics()),
+        ("cache", cache.cache.stats.as_dict()),
+        ("password_hashing", password_hasher.stats()),
+        ("imports", import_workers.stats()),
+        ("coalescing", coalesce.single_flight.stats()),
+    ):
+        for name, value in values.items():
+            if isinstance(value, (bool, int, float)):
+                gauges[f"{prefix}_{name}"] = float(value)
+    return instrumentation.prometheus_metrics(gauges)
 
 
 @app.get("/users", response_model=List[schema.User])
 async def get_user(
-    skip: int = 0, limit: int = 15, db: Session = Depends(get_db)
+    response: Response,
+    request: Request,
+    skip: int = 0,
+    limit: int = 15,
+    cursor: Optional[str] = None,
+    count: Optional[Literal["exact", "estimated"]] = None,
+    name: Optional[str] = None,
+    login: Optional[str] = None,
+    role: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
 ) -> List[schema.User]:
 
-    db_user = db.query(models.User).offset(skip).limit(limit).all()
+    # unchanged since the copy of the client: 304 without any query
+    not_modified = await versions.conditional_get(request, response, "users")
+    if not_modified is not None:
+        return not_modified
+
+    # name and login: case-insensitive substring search, see search.py
+    filters = search.user_filters(db, name, login, role)
+    if config.READ_PATH == "core":
+
+        async def load(db):
+            page = await crud.user_rows_page(db, cursor, skip, limit, filters)
+            await set_page_headers(
+                db, response, page, models.User.__table__, count, filters
+            )
+            return list_response(page.rows, response)
+
+        return await coalesce.shared_response(request, response, load)
+
+    page = await paginate(
+        db,
+        select(models.User),
+        models.User.id,
+        response,
+        cursor,
+        skip,
+        limit,
+        count,
+        filters=filters,
+    )
+    db_user = page.rows
     if db_user is None:
         # relever une exception
-        raise HTTPException(status_code=404, details="No_items")
+        raise HTTPException(status_code=404, detail="No_items")
     return db_user
 
 
 @app.post("/create_users", response_model=schema.User)
-async def create_user(user: schema.UserCreate, db: Session = Depends(get_db)):
+async def create_user(
+    user: schema.UserCreate, db: AsyncSession = Depends(get_db)
+):
 
     try:
-        hashed_password = hash_password(user.password)
+        hashed_password = await hash_password_async(user.password)
         db_user = models.User(
             name=user.name,
             login=user.login,
@@ -49,84 +228,218 @@ async def create_user(user: schema.UserCreate, db: Session = Depends(get_db)):
             role=user.role,
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        await versions.bump("users")
         return db_user
+    except PasswordPoolBusy:
+        raise
+    except IntegrityError:
+        # the unique index on users.login, as reported by the bulk endpoint
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Login already exists")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
 
         print(f"Error {e}")
 
         raise HTTPException(status_code=500, detail="connexion failed ")
 
 
+@app.post(
+    "/create_users/bulk",
+    response_model=schema.BulkUserResult,
+    openapi_extra=payloads.openapi_body(schema.UserCreate, single=False),
+)
+async def create_users_bulk(
+    users: List[schema.UserCreate] = Depends(
+        payloads.body(schema.UserCreate, single=False)
+    ),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        created, errors = await crud.bulk_create_users(db, users, atomic)
+    except PasswordPoolBusy:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"connexion failed:{str(e)}"
+        )
+    if atomic and errors:
+        raise HTTPException(
+            status_code=422, detail=[error.model_dump() for error in errors]
+        )
+    if created:
+        await versions.bump("users")
+    return bulk_response(created, errors)
+
+
+@app.post("/login", response_model=schema.Token)
+async def login(
+    credentials: schema.LoginRequest, db: AsyncSession = Depends(get_db)
+):
+    """Check the password once and return a short-lived bearer token."""
+    result = await db.execute(
+        select(models.User.id, models.User.password).where(
+            models.User.login == credentials.login
+        )
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=401, detail="invalid credentials")
+    valid, new_hash = await verify_and_update_password_async(
+        credentials.password, row.password
+    )
+    if not valid:
+        raise HTTPException(status_code=401, detail="invalid credentials")
+    if new_hash is not None:
+        # stored with an outdated bcrypt cost
+        await db.execute(
+            update(models.User)
+            .where(models.User.id == row.id)
+            .values(password=new_hash)
+        )
+        await db.commit()
+        # /users returns the password column
+        await versions.bump("users")
+    return {
+        "access_token": auth.issue_token(row.id),
+        "expires_in": config.AUTH_TOKEN_TTL,
+    }
+
+
+async def token_allows(db: AsyncSession, token_user, user_id: int) -> bool:
+    if token_user is None:
+        return False
+    if token_user == user_id:
+        return True
+    _, role = await crud.get_user_role(db, token_user)
+    return role == "admin"
+
+
 @app.put("/user_update/{user_id}")
 async def update_user(
     user_id: int,
     user: schema.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     password: str = None,
+    token_user: Optional[int] = Depends(auth.token_user_id),
 ):
 
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="can not found the user ")
-    if db_user.role != "admin":
+    # a bearer token of the user or of an admin replaces the password, so
+    # bcrypt only runs for the legacy password parameter
+    if db_user.role != "admin" and not await token_allows(
+        db, token_user, user_id
+    ):
         if not password:
             raise HTTPException(
                 status_code=403,
                 detail="user is not admin and password is empty",
             )
-        if not verify_password(password, db_user.password):
+        valid, new_hash = await verify_and_update_password_async(
+            password, db_user.password
+        )
+        if not valid:
             raise HTTPException(
                 status_code=403, detail="the password did not match"
             )
+        if new_hash is not None:
+            db_user.password = new_hash
 
     db_user.name = user.name
     db_user.login = user.login
     if user.password is not None:
-        db_user.password = hash_password(user.password)
+        db_user.password = await hash_password_async(user.password)
     db_user.phone = user.phone
     db_user.role = user.role
-    db.commit()
-    db.refresh(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        if user.login is not None and await crud.existing_ids(
+            db, models.User.login, {user.login}
+        ):
+            raise HTTPException(status_code=409, detail="Login already exists")
+        raise
+    await db.refresh(db_user)
+    await cache.invalidate_user(user_id)
+    await versions.bump("users")
 
     return db_user
 
 
 @app.delete("/delete_user/{user_id}", response_model=Dict[str, str])
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        db_user = (
-            db.query(models.User).filter(models.User.id == user_id).first()
-        )
-        if db_user is None:
+        if not await crud.delete_user(db, user_id):
             raise HTTPException(status_code=404, detail="User not found")
-
-        db.delete(db_user)
-        db.commit()
+        await cache.invalidate_user(user_id)
+        # the students of the user now have a NULL user_id
+        await versions.bump("users", "students")
 
         return {"detail": "User deleted successfuly"}
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(detail=f"An error occured {str(e)}")
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"An error occured {str(e)}"
+        )
 
 
 @app.get("/students")
 async def get_student(
-    skip: int = 0, limit: int = 15, db: Session = Depends(get_db)
+    response: Response,
+    request: Request,
+    skip: int = 0,
+    limit: int = 15,
+    cursor: Optional[str] = None,
+    count: Optional[Literal["exact", "estimated"]] = None,
+    name: Optional[str] = None,
+    lab: Optional[str] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
 ) -> List[schema.StudentWithCourse]:
 
-    db_student = (
-        db.query(models.Student)
-        .options(joinedload(models.Student.courses))
-        .offset(skip)
-        .limit(limit)
-        .all()
+    # unchanged since the copy of the client: 304 without any query
+    not_modified = await versions.conditional_get(
+        request, response, "students", "courses"
+    )
+    if not_modified is not None:
+        return not_modified
+
+    # name: case-insensitive substring search; course_id: students taking
+    # that course (with all their courses), see search.py
+    filters = search.student_filters(db, name, lab, user_id, course_id)
+    if config.READ_PATH == "core":
+
+        async def load(db):
+            page = await crud.student_rows_page(
+                db, config.STUDENTS_LOAD_STRATEGY, cursor, skip, limit, filters
+            )
+            await set_page_headers(
+                db, response, page, models.Student.__table__, count, filters
+            )
+            return list_response(page.rows, response)
+
+        return await coalesce.shared_response(request, response, load)
+
+    page = await crud.student_page(
+        db, config.STUDENTS_LOAD_STRATEGY, cursor, skip, limit, filters
+    )
+    await set_page_headers(
+        db, response, page, models.Student.__table__, count, filters
     )
+    db_student = page.rows
     if db_student is None:
         # relver une exception
-        raise HTTPException(status_code=404, details="No student  found")
+        raise HTTPException(status_code=404, detail="No student  found")
     return db_student
     # students = db.query(models.Student).offset(skip).limit(limit).all()
     # if not students:
@@ -138,67 +451,156 @@ async def get_student(
     # return students
 
 
-@app.post("/create_students", response_model=List[schema.Student])
-async def create_student(
-    user_id,
-    students: List[schema.StudentCreate] | schema.StudentCreate,
-    db: Session = Depends(get_db),
+async def get_admin(
+    db: AsyncSession, user_id: int, detail: str, status_code: int = 404
 ):
-
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+    # the role is read through the cache, see crud.get_user_role
+    exists, role = await crud.get_user_role(db, user_id)
+    if not exists:
         raise HTTPException(status_code=404, detail=" user not found ")
 
-    if user.role != "admin":
-        raise HTTPException(
-            status_code=404, detail="Only admin can create an user "
-        )
+    if role != "admin":
+        raise HTTPException(status_code=status_code, detail=detail)
 
-    def create_single_student(student: schema.StudentCreate):
 
-        user = (
-            db.query(models.User)
-            .filter(models.User.id == student.user_id)
-            .first()
+@app.get("/students/export")
+async def export_students(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    lab: Optional[str] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+):
+    """
+    Stream every student (optionally filtered) with its courses, as NDJSON
+    (one student per line) or CSV (course ids joined by ";", course titles
+    as a JSON array).
+    """
+    statement = export.export_statement(lab, user_id, course_id)
+    replica = routing.use_replica(request)
+    if format == "csv":
+        return StreamingResponse(
+            export.csv_lines(statement, replica=replica),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": 'attachment; filename="students.csv"'
+            },
         )
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    return StreamingResponse(
+        export.ndjson_lines(statement, replica=replica),
+        media_type="application/x-ndjson",
+    )
 
-        db_student = models.Student(
-            name=student.name,
-            lab=student.lab,
-            user_id=student.user_id,
-            # course_id=student.course_id
-        )
-        if student.course_id:
-            courses = (
-                db.query(models.Course)
-                .filter(models.Course.id.in_(student.course_id))
-                .all()
-            )
 
-        if len(courses) != len(student.course_id):
-            raise HTTPException(
-                status_code=404, detail="Some courses not found"
-            )
-        db_student.courses = courses
-        db.add(db_student)
-        db.commit()
-        db.refresh(db_student)
-        return db_student
+@app.post(
+    "/create_students",
+    response_model=List[schema.Student],
+    openapi_extra=payloads.openapi_body(schema.StudentCreate),
+)
+async def create_student(
+    students: List[schema.StudentCreate] | schema.StudentCreate = Depends(
+        payloads.body(schema.StudentCreate)
+    ),
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
+):
 
-    try:
-        if isinstance(students, list):
-            list_student = []
-            for student in students:
-                list_student.append(create_single_student(student))
-            return list_student
-        else:
-            return [create_single_student]
+    await get_admin(db, user_id, "Only admin can create an user ")
+
+    if not isinstance(students, list):
+        students = [students]
 
+    # all-or-nothing: the whole batch is written in one transaction
+    try:
+        created, errors = await crud.bulk_create_students(
+            db, students, atomic=True
+        )
     except Exception as e:
+        await db.rollback()
         print(f"Error {e}")
         raise HTTPException(status_code=500, detail="connexion failed ")
+    if errors:
+        raise HTTPException(status_code=404, detail=errors[0].detail)
+    await versions.bump("students")
+    return FastJSONResponse(created)
+
+
+@app.post(
+    "/create_students/bulk",
+    response_model=schema.BulkStudentResult,
+    openapi_extra=payloads.openapi_body(schema.StudentCreate, single=False),
+)
+async def create_students_bulk(
+    students: List[schema.StudentCreate] = Depends(
+        payloads.body(schema.StudentCreate, single=False)
+    ),
+    atomic: bool = False,
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Insert a batch of students in one transaction.
+
+    Rejected items are listed in `errors` while the valid ones are created,
+    unless `atomic` is set, in which case any error cancels the whole batch.
+    """
+    await get_admin(db, user_id, "Only admin can create an user ")
+
+    try:
+        created, errors = await crud.bulk_create_students(db, students, atomic)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"connexion failed:{str(e)}"
+        )
+    if atomic and errors:
+        raise HTTPException(
+            status_code=422, detail=[error.model_dump() for error in errors]
+        )
+    if created:
+        await versions.bump("students")
+    return bulk_response(created, errors)
+
+
+@app.post(
+    "/create_students/jobs", status_code=202, response_model=schema.ImportJob
+)
+async def create_students_job(
+    request: Request,
+    response: Response,
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Queue an import of students and return the job at once (202).
+
+    The body is a JSON list (as for /create_students/bulk), NDJSON
+    (application/x-ndjson) or CSV (text/csv: name, lab, user_id, course_id
+    with ";" between the ids), or a multipart upload of such a file in the
+    field `file`. The rows are validated and inserted in the background,
+    in chunks; the valid rows are created and the others reported by
+    GET /jobs/{id}.
+    """
+    await get_admin(db, user_id, "Only admin can create an user ")
+    rows = await jobs.read_rows(request)
+    job = await jobs.create_job(db, "students", rows, user_id)
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=schema.ImportJob)
+async def get_job(
+    job_id: str,
+    errors_limit: int = 100,
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Progress, throughput and the first `errors_limit` row errors."""
+    await get_admin(db, user_id, "Only admin can read an import job ")
+    job = await jobs.job_status(db, job_id, errors_limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 
 # @app.put(
@@ -208,198 +610,251 @@ async def create_student(
 @app.put(
     "/student_update/",
     response_model=Union[List[schema.Student], schema.Student],
+    openapi_extra=payloads.openapi_body(schema.StudentUpdate),
 )
 async def update_student(
-    user_id: int,
     # student_id: int,
-    student_updates: Union[List[schema.StudentUpdate], schema.StudentUpdate],
-    db: Session = Depends(get_db),
+    student_updates: Union[
+        List[schema.StudentUpdate], schema.StudentUpdate
+    ] = Depends(payloads.body(schema.StudentUpdate)),
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+    exists, _ = await crud.get_user_role(db, user_id)
+    if not exists:
         raise HTTPException(status_code=404, detail=" user not found ")
 
     # if user.role != "admin":
     #     raise HTTPException(status_code=404, detail="Only admin can create an user ")
 
-    def update_one_student(student_update: schema.StudentUpdate):
-        db_student = (
-            db.query(models.Student)
-            .filter(models.Student.id == student_update.id)
-            .first()
-        )
-        if db_student is None:
-            raise HTTPException(
-                status_code=404, detail="can not found the student"
-            )
-
-        if student_update.name is not None:
-
-            db_student.name = student_update.name
-
-        if student_update.lab is not None:
-
-            db_student.lab = student_update.lab
-
-        # if student_update.user_id is not None:
-        #     user = (
-        #         db.query(models.User)
-        #         .filter(models.User.id == student_update.user_id)
-        #         .first()
-        #     )
-        #     if not user:
-        #         raise HTTPException(status_code=404, detail="user not found ")
-
-        #     db_student.user_id = student_update.user_id
-        if student_update.course_id is not None:
-            course = (
-                db.query(models.Course)
-                .filter(models.Course.id.in_(student_update.course_id))
-                .all()
-            )
-            if len(course) != len(student_update.course_id):
-                raise HTTPException(
-                    status_code=404,
-                    detail="the lenght of course is different than the length of user_id",
-                )
-
-            db_student.course_id = student_update.course_id
-
-        db.commit()
-
-        db.refresh(db_student)
-
-        return db_student
-
-    # update_student = []
+    # the whole batch is validated then written in one transaction
+    items = (
+        student_updates
+        if isinstance(student_updates, list)
+        else [student_updates]
+    )
     try:
-        if isinstance(student_updates, list):
-            list_student_update = []
-            for student_update in student_updates:
-                list_student_update.append(update_one_student(student_update))
-            return list_student_update
-        else:
-            return update_one_student(student_updates)
-
+        updated, errors = await crud.bulk_update_students(db, items)
+    except HTTPException:
+        raise
     except Exception as e:
+        await db.rollback()
         print(f"Error {e}")
         raise HTTPException(status_code=500, detail="connexion failed ")
 
+    if errors:
+        raise HTTPException(status_code=404, detail=errors[0].detail)
+    await versions.bump("students")
+    if isinstance(student_updates, list):
+        return FastJSONResponse(updated)
+    return FastJSONResponse(updated[0])
+
 
-# @app.delete("/delete_student/", response_model=Dict[str, str])
 @app.delete(
     "/delete_student/",
-    response_model=Dict[str, Union[str, List[Dict[str, str]]]],
+    response_model=schema.BulkDeleteResult,
+    openapi_extra=payloads.openapi_body(schema.StudentDelete),
 )
 async def delete_student(
-    user_id: int,
-    student_deletes: Union[List[schema.StudentDelete] | schema.StudentDelete],
-    db: Session = Depends(get_db),
+    student_deletes: Union[
+        List[schema.StudentDelete] | schema.StudentDelete
+    ] = Depends(payloads.body(schema.StudentDelete)),
+    user_id: int = Depends(auth.caller_id),
+    db: AsyncSession = Depends(get_db),
 ):
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail=" user not found ")
-
-    if user.role != "admin":
-        raise HTTPException(
-            status_code=403, detail="Only admin can delete an user "
-        )
-
-    def delete_on_student(student_delete: schema.StudentDelete):
-
-        db_student = (
-            db.query(models.Student)
-            .filter(models.Student.id == student_delete.id)
-            .first()
-        )
-        if db_student is None:
-            raise HTTPException(status_code=404, detail="student not found")
-        db.delete(db_student)
-        db.commit()
-        return {
-            "detail": f"student with ID {student_delete.id} deleted successfuly"
-        }
+    await get_admin(db, user_id, "Only admin can delete an user ", 403)
 
+    # one DELETE ... RETURNING for the whole batch, in one transaction
+    if isinstance(student_deletes, list):
+        ids = [student_delete.id for student_delete in student_deletes]
+    else:
+        ids = [student_deletes.id]
     try:
-        if isinstance(student_deletes, list):
-            list_deletes_student = []
-            for student_delete in student_deletes:
-                list_deletes_student.append(delete_on_student(student_delete))
-
-            return {
-                "detail": "Students deleted successfully",
-                "students": list_deletes_student,
-            }
-        else:
-
-            return {
-                "detail": "Students deleted successfully",
-                "students": delete_on_student(student_deletes),
-            }
-
+        deleted, missing = await crud.delete_students(db, ids)
     except Exception as e:
+        await db.rollback()
         print(f"str{e}")
         raise HTTPException(
             status_code=500, detail=" can not delete any student"
         )
 
+    if deleted:
+        await versions.bump("students")
+    if not isinstance(student_deletes, list) and missing:
+        raise HTTPException(status_code=404, detail="student not found")
+    return FastJSONResponse(
+        {
+            "detail": "Students deleted successfully",
+            "deleted": deleted,
+            "missing": missing,
+        }
+    )
+
 
 @app.get("/courses", response_model=List[schema.Course])
 async def get_course(
-    skip: int = 0, limit: int = 15, db: Session = Depends(get_db)
+    response: Response,
+    request: Request,
+    skip: int = 0,
+    limit: int = 15,
+    cursor: Optional[str] = None,
+    count: Optional[Literal["exact", "estimated"]] = None,
+    db: AsyncSession = Depends(get_read_db),
 ) -> List[schema.Course]:
 
-    db_course = db.query(models.Course).offset(skip).limit(limit).all()
+    # unchanged since the copy of the client: 304 without any query
+    not_modified = await versions.conditional_get(request, response, "courses")
+    if not_modified is not None:
+        return not_modified
+
+    if config.READ_PATH == "core":
+
+        async def load(db):
+            page = await crud.course_rows_page(db, cursor, skip, limit)
+            await set_page_headers(
+                db, response, page, models.Course.__table__, count
+            )
+            return list_response(page.rows, response)
+
+        return await coalesce.shared_response(request, response, load)
+
+    page = await paginate(
+        db,
+        select(models.Course),
+        models.Course.id,
+        response,
+        cursor,
+        skip,
+        limit,
+        count,
+    )
+    db_course = page.rows
     if db_course is None:
         # relver une exception
         raise HTTPException(status_code=404, detail="No course found")
     return db_course
 
 
-@app.post("/create_courses", response_model=List[schema.Course])
+@app.get("/courses/stats", response_model=List[schema.CourseStats])
+async def get_course_stats(
+    response: Response,
+    request: Request,
+    skip: int = 0,
+    limit: int = 15,
+    cursor: Optional[str] = None,
+    count: Optional[Literal["exact", "estimated"]] = None,
+    db: AsyncSession = Depends(get_read_db),
+) -> List[schema.CourseStats]:
+    """Number of students of each course, read from the counters."""
+    not_modified = await versions.conditional_get(
+        request, response, "students", "courses"
+    )
+    if not_modified is not None:
+        return not_modified
+
+    async def load(db):
+        page = await crud.course_stats_page(db, cursor, skip, limit)
+        await set_page_headers(
+            db, response, page, models.Course.__table__, count
+        )
+        return list_response(page.rows, response)
+
+    return await coalesce.shared_response(request, response, load)
+
+
+@app.get("/users/{user_id}/stats", response_model=schema.UserStats)
+async def get_user_stats(
+    user_id: int,
+    response: Response,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+) -> schema.UserStats:
+    """Number of students of a user, read from the counters."""
+    not_modified = await versions.conditional_get(
+        request, response, "students", "users"
+    )
+    if not_modified is not None:
+        return not_modified
+
+    stats = await crud.user_stats(db, user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=" user not found ")
+    return stats
+
+
+@app.post(
+    "/create_courses",
+    response_model=List[schema.Course],
+    openapi_extra=payloads.openapi_body(schema.CourseCreate),
+)
 async def create_course(
-    courses: Union[List[schema.CourseCreate], schema.CourseCreate],
-    db: Session = Depends(get_db),
+    courses: Union[List[schema.CourseCreate], schema.CourseCreate] = Depends(
+        payloads.body(schema.CourseCreate)
+    ),
+    db: AsyncSession = Depends(get_db),
 ):
 
-    try:
+    if not isinstance(courses, list):
+        courses = [courses]
 
-        def create_a_course(course: schema.CourseCreate):
+    try:
+        created, errors = await crud.bulk_create_courses(
+            db, courses, atomic=True
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"connexion failed:{str(e)}"
+        )
+    if errors:
+        raise HTTPException(status_code=422, detail=errors[0].detail)
+    await cache.invalidate_courses()
+    await versions.bump("courses")
+    return FastJSONResponse(created)
 
-            db_course = models.Course(title=course.title)
-            db.add(db_course)
-            db.commit()
-            db.refresh(db_course)
-            return db_course
 
-        if isinstance(courses, list):
-            return [create_a_course(course) for course in courses]
-        else:
-            return create_a_course(courses)
+@app.post(
+    "/create_courses/bulk",
+    response_model=schema.BulkCourseResult,
+    openapi_extra=payloads.openapi_body(schema.CourseCreate, single=False),
+)
+async def create_courses_bulk(
+    courses: List[schema.CourseCreate] = Depends(
+        payloads.body(schema.CourseCreate, single=False)
+    ),
+    atomic: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        created, errors = await crud.bulk_create_courses(db, courses, atomic)
     except Exception as e:
-
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"connexion failed:{str(e)}"
         )
+    if atomic and errors:
+        raise HTTPException(
+            status_code=422, detail=[error.model_dump() for error in errors]
+        )
+    if created:
+        await cache.invalidate_courses()
+        await versions.bump("courses")
+    return bulk_response(created, errors)
 
 
 @app.put("/course_update/{course_id}", response_model=List[schema.Course])
 async def update_course(
     course_id: int,
     course_updates: Union[List[schema.CourseUpdate], schema.CourseUpdate],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
 
     try:
 
-        def update_a_course(course_update: schema.CourseUpdate):
+        async def update_a_course(course_update: schema.CourseUpdate):
 
-            db_course = (
-                db.query(models.Course)
-                .filter(models.Course.id == course_id)
-                .first()
-            )
+            db_course = await db.get(models.Course, course_id)
             if db_course is None:
                 raise HTTPException(
                     status_code=404, detail="can not found the course "
@@ -408,39 +863,41 @@ async def update_course(
             if course_update.title is not None:
 
                 db_course.title = course_update.title
-            db.commit()
-            db.refresh(db_course)
+            await db.commit()
+            await db.refresh(db_course)
+            await cache.invalidate_courses(course_id)
+            await versions.bump("courses")
 
             return db_course
 
         if isinstance(course_updates, list):
             return [
-                update_a_course(course_update)
+                await update_a_course(course_update)
                 for course_update in course_updates
             ]
         else:
-            return update_a_course(course_updates)
+            return [await update_a_course(course_updates)]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occur {str(e)}")
 
 
 @app.delete("/delete_course/{course_id}", response_model=Dict[str, str])
-async def delete_course(course_id: int, db: Session = Depends(get_db)):
+async def delete_course(course_id: int, db: AsyncSession = Depends(get_db)):
     try:
 
-        db_course = (
-            db.query(models.Course)
-            .filter(models.Course.id == course_id)
-            .first()
-        )
-        if db_course is None:
+        if not await crud.delete_course(db, course_id):
             raise HTTPException(status_code=404, detail="course not found")
 
-        db.delete(db_course)
-        db.commit()
+        await cache.invalidate_courses(course_id)
+        # the links to the course were removed with it
+        await versions.bump("courses")
         return {"detail": "Course deleted successfuly"}
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"An error occured {str(e)}"
         )
@@ -0,0 +1,82 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, make_url, pool
+
+import config as app_config
+import models  # noqa: F401  (registers the tables on Base.metadata)
+from database import Base
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# objects autogenerate must not compare: the SQLite FTS5 tables of the
+# substring search (and their shadow tables), created by raw DDL, and the
+# indexes declared for another dialect (the Postgres trigram indexes)
+FTS_TABLES = tuple(f"{table}_fts" for table in models.SEARCH_COLUMNS)
+
+
+def include_object_for(dialect_name: str):
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == "table" and name.startswith(FTS_TABLES):
+            return False
+        ddl_if = getattr(object, "_ddl_if", None)
+        if type_ == "index" and ddl_if is not None and ddl_if.dialect:
+            dialects = ddl_if.dialect
+            if isinstance(dialects, str):
+                dialects = (dialects,)
+            return dialect_name in dialects
+        return True
+
+    return include_object
+
+
+def run_migrations_offline() -> None:
+    """Emit the SQL of the migrations without connecting (alembic --sql)."""
+    context.configure(
+        url=app_config.DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        include_object=include_object_for(
+            make_url(app_config.DATABASE_URL).get_backend_name()
+        ),
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations(connection) -> None:
+    # batch mode lets the same migrations alter tables on SQLite
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=True,
+        include_object=include_object_for(connection.dialect.name),
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # database_populate.py passes the connection of the database it seeds
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+    connectable = create_engine(
+        app_config.DATABASE_URL, poolclass=pool.NullPool
+    )
+    with connectable.connect() as connection:
+        run_migrations(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
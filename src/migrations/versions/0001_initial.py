@@ -0,0 +1,59 @@
+"""initial schema, as created by Base.metadata.create_all before migrations
+
+A database created by the previous versions of the app already has these
+tables: mark it with `alembic stamp 0001` and then run `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("login", sa.String(100), nullable=False),
+        sa.Column("password", sa.String(100), nullable=False),
+        sa.Column("phone", sa.String(100), nullable=False),
+        sa.Column("role", sa.String(100)),
+    )
+    op.create_table(
+        "courses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+    )
+    op.create_table(
+        "students",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("lab", sa.String(100), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    op.create_table(
+        "student_course",
+        sa.Column("student_id", sa.Integer(), sa.ForeignKey("students.id")),
+        sa.Column("course_id", sa.Integer(), sa.ForeignKey("courses.id")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("student_course")
+    op.drop_table("students")
+    op.drop_table("courses")
+    op.drop_table("users")
@@ -0,0 +1,75 @@
+"""indexes and uniqueness constraints for the hot lookups
+
+- composite primary key (student_id, course_id) on student_course, after
+  removing duplicated and incomplete links
+- index on student_course.course_id (students of a course)
+- index on students.user_id
+- unique users.login; fails if duplicated logins exist, they have to be
+  fixed by hand first
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "DELETE FROM student_course "
+        "WHERE student_id IS NULL OR course_id IS NULL"
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "DELETE FROM student_course a USING student_course b "
+            "WHERE a.ctid < b.ctid AND a.student_id = b.student_id "
+            "AND a.course_id = b.course_id"
+        )
+    else:
+        op.execute(
+            "DELETE FROM student_course WHERE rowid NOT IN ("
+            "SELECT min(rowid) FROM student_course "
+            "GROUP BY student_id, course_id)"
+        )
+
+    with op.batch_alter_table("student_course") as batch_op:
+        batch_op.alter_column(
+            "student_id", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.alter_column(
+            "course_id", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.create_primary_key(
+            "pk_student_course", ["student_id", "course_id"]
+        )
+        batch_op.create_index("ix_student_course_course_id", ["course_id"])
+
+    op.create_index("ix_students_user_id", "students", ["user_id"])
+    op.create_index("ix_users_login", "users", ["login"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_users_login", table_name="users")
+    op.drop_index("ix_students_user_id", table_name="students")
+    with op.batch_alter_table("student_course") as batch_op:
+        batch_op.drop_index("ix_student_course_course_id")
+        batch_op.drop_constraint("pk_student_course", type_="primary")
+        batch_op.alter_column(
+            "course_id", existing_type=sa.Integer(), nullable=True
+        )
+        batch_op.alter_column(
+            "student_id", existing_type=sa.Integer(), nullable=True
+        )
@@ -0,0 +1,109 @@
+"""ON DELETE actions on the foreign keys
+
+- student_course links are removed with their student or course
+  (ON DELETE CASCADE)
+- students.user_id is set to NULL when the user is deleted
+  (ON DELETE SET NULL), as the ORM did before by loading the students
+
+SQLite cannot alter a constraint, the two tables are recreated instead.
+The app enables the SQLite foreign keys on each connection.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referred table, ON DELETE action), the constraint names
+# are the Postgres defaults given to the unnamed keys of revision 0001
+FOREIGN_KEYS = (
+    ("student_course", "student_id", "students", "CASCADE"),
+    ("student_course", "course_id", "courses", "CASCADE"),
+    ("students", "user_id", "users", "SET NULL"),
+)
+
+
+def sqlite_tables(with_actions: bool):
+    """Definitions of the recreated tables, with or without the actions."""
+
+    def action(name):
+        return name if with_actions else None
+
+    metadata = sa.MetaData()
+    link = sa.Table(
+        "student_course",
+        metadata,
+        sa.Column(
+            "student_id",
+            sa.Integer(),
+            sa.ForeignKey("students.id", ondelete=action("CASCADE")),
+            nullable=False,
+        ),
+        sa.Column(
+            "course_id",
+            sa.Integer(),
+            sa.ForeignKey("courses.id", ondelete=action("CASCADE")),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint(
+            "student_id", "course_id", name="pk_student_course"
+        ),
+        sa.Index("ix_student_course_course_id", "course_id"),
+    )
+    students = sa.Table(
+        "students",
+        metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("lab", sa.String(100), nullable=False),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete=action("SET NULL")),
+        ),
+        sa.Index("ix_students_user_id", "user_id"),
+    )
+    return link, students
+
+
+def set_actions(with_actions: bool):
+    if op.get_bind().dialect.name == "sqlite":
+        for table in sqlite_tables(with_actions):
+            with op.batch_alter_table(
+                table.name, copy_from=table, recreate="always"
+            ):
+                pass
+        return
+
+    for table, column, referred, action in FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(
+            name,
+            table,
+            referred,
+            [column],
+            ["id"],
+            ondelete=action if with_actions else None,
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    set_actions(True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    set_actions(False)
@@ -0,0 +1,89 @@
+"""indexes for the filters and the substring search of the list endpoints
+
+- index on students.lab
+- Postgres: pg_trgm extension and GIN trigram indexes on students.name,
+  users.name and users.login (ILIKE '%term%'), built CONCURRENTLY so the
+  tables stay writable
+- SQLite: FTS5 trigram tables students_fts(name) and users_fts(name,
+  login) over the base tables, filled once and kept in sync by triggers;
+  a later migration recreating these tables must recreate the triggers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = {
+    "students": ("name",),
+    "users": ("name", "login"),
+}
+
+
+def sqlite_fts(table: str, columns):
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    op.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, "
+        f"content='{table}', content_rowid='id', tokenize='trigram')"
+    )
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    op.execute(
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_students_lab", "students", ["lab"])
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        with op.get_context().autocommit_block():
+            for table, columns in SEARCH_COLUMNS.items():
+                for column in columns:
+                    op.execute(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                        f"ix_{table}_{column}_trgm ON {table} "
+                        f"USING gin ({column} gin_trgm_ops)"
+                    )
+    elif op.get_bind().dialect.name == "sqlite":
+        for table, columns in SEARCH_COLUMNS.items():
+            sqlite_fts(table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                op.execute(f"DROP INDEX IF EXISTS ix_{table}_{column}_trgm")
+    elif op.get_bind().dialect.name == "sqlite":
+        for table in SEARCH_COLUMNS:
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    op.drop_index("ix_students_lab", table_name="students")
@@ -0,0 +1,62 @@
+"""precomputed student counters per course and per user
+
+- course_stats(course_id, students) and user_stats(user_id, students),
+  removed with their course or user (ON DELETE CASCADE)
+- filled from the current student_course and students rows; the API keeps
+  them up to date and recomputes them periodically (counters.py)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "course_stats",
+        sa.Column(
+            "course_id",
+            sa.Integer(),
+            sa.ForeignKey("courses.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("students", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "user_stats",
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("students", sa.Integer(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO course_stats (course_id, students) "
+        "SELECT course_id, count(*) FROM student_course GROUP BY course_id"
+    )
+    op.execute(
+        "INSERT INTO user_stats (user_id, students) "
+        "SELECT user_id, count(*) FROM students "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("user_stats")
+    op.drop_table("course_stats")
@@ -0,0 +1,75 @@
+"""background import jobs
+
+- import_jobs: one row per job with its status and counters
+- import_job_chunks: the submitted rows of a job by chunks until they are
+  processed, then the per-row errors; a partial index on the chunks still
+  to process serves as the queue
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("kind", sa.String(32), nullable=False),
+        sa.Column("status", sa.String(16), nullable=False),
+        sa.Column("created_by", sa.Integer()),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("processed", sa.Integer(), nullable=False),
+        sa.Column("created", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.Float(), nullable=False),
+        sa.Column("started_at", sa.Float()),
+        sa.Column("finished_at", sa.Float()),
+    )
+    op.create_table(
+        "import_job_chunks",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "job_id",
+            sa.String(32),
+            sa.ForeignKey("import_jobs.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("first_row", sa.Integer(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("rows", sa.JSON()),
+        sa.Column("errors", sa.JSON()),
+        sa.Column("done", sa.Boolean(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("claim", sa.String(32)),
+        sa.Column("lease_until", sa.Float()),
+    )
+    op.create_index(
+        "ix_import_job_chunks_job_id", "import_job_chunks", ["job_id"]
+    )
+    op.create_index(
+        "ix_import_job_chunks_pending",
+        "import_job_chunks",
+        ["id"],
+        postgresql_where=sa.text("NOT done"),
+        sqlite_where=sa.text("done = 0"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("import_job_chunks")
+    op.drop_table("import_jobs")
@@ -1,4 +1,5 @@
-from sqlalchemy import Table, ForeignKey, String, Integer, Column
+from sqlalchemy import DDL, JSON, Boolean, Column, Float, ForeignKey, Index
+from sqlalchemy import Integer, String, Table, event, text
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -6,8 +7,19 @@ from database import Base
 student_course = Table(
     "student_course",
     Base.metadata,
-    Column("student_id", Integer, ForeignKey("students.id")),
-    Column("course_id", Integer, ForeignKey("courses.id")),
+    Column(
+        "student_id",
+        Integer,
+        ForeignKey("students.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "course_id",
+        Integer,
+        ForeignKey("courses.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
 )
 
 
@@ -17,25 +29,36 @@ class User(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
-    login = Column(String(100), nullable=False)
+    login = Column(String(100), nullable=False, unique=True, index=True)
     password = Column(String(100), nullable=False)
     phone = Column(String(100), nullable=False)
     role = Column(String(100), default="user")
     # Establish a one to many relationship with student
-    students = relationship("Student", back_populates="user")
+    # deleting a user keeps its students, their user_id is set to NULL by
+    # the database (ON DELETE SET NULL) without loading them
+    students = relationship(
+        "Student", back_populates="user", passive_deletes=True
+    )
 
 
 class Student(Base):
     __tablename__ = "students"
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
-    lab = Column(String(100), nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    lab = Column(String(100), nullable=False, index=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True
+    )
     # link back to user
 
     user = relationship("User", back_populates="students")
+    # the links of a deleted student or course are removed by the database
+    # (ON DELETE CASCADE)
     courses = relationship(
-        "Course", secondary=student_course, back_populates="students"
+        "Course",
+        secondary=student_course,
+        back_populates="students",
+        passive_deletes=True,
     )
 
 
@@ -44,5 +67,158 @@ class Course(Base):
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     students = relationship(
-        "Student", secondary=student_course, back_populates="courses"
+        "Student",
+        secondary=student_course,
+        back_populates="courses",
+        passive_deletes=True,
+    )
+
+
+# Precomputed counters, see counters.py. A row is removed with its course
+# or user (ON DELETE CASCADE); a missing row means no student.
+
+
+class CourseStats(Base):
+    __tablename__ = "course_stats"
+    course_id = Column(
+        Integer,
+        ForeignKey("courses.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    students = Column(Integer, nullable=False, default=0)
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    students = Column(Integer, nullable=False, default=0)
+
+
+# Background imports, see jobs.py. The rows of a job are stored in chunks
+# until they are processed, so a job survives a restart of the workers.
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(32), nullable=False)
+    # queued, running, done
+    status = Column(String(16), nullable=False, default="queued")
+    created_by = Column(Integer)
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    created = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # timestamps (time.time())
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+
+
+class ImportJobChunk(Base):
+    __tablename__ = "import_job_chunks"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(
+        String(32),
+        ForeignKey("import_jobs.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # index in the job of the first row of the chunk
+    first_row = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    # the submitted rows, cleared once processed
+    rows = Column(JSON(none_as_null=True))
+    # per-row errors, [{"index": ..., "detail": ...}]
+    errors = Column(JSON(none_as_null=True))
+    done = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # the worker processing the chunk and until when (lease)
+    claim = Column(String(32))
+    lease_until = Column(Float)
+    __table_args__ = (
+        # the queue: only the chunks still to process are indexed (the
+        # predicates are the SQL of not_(done) on each database, which the
+        # SQLite planner needs to match literally)
+        Index(
+            "ix_import_job_chunks_pending",
+            "id",
+            postgresql_where=text("NOT done"),
+            sqlite_where=text("done = 0"),
+        ),
+    )
+
+
+# Substring search indexes (see search.py), also created by migration 0004.
+#
+# Postgres: GIN trigram indexes (pg_trgm), used by `ILIKE '%term%'`.
+# SQLite: FTS5 tables with the trigram tokenizer over the same columns,
+# kept in sync with the base tables by triggers ("external content" tables:
+# the text is not stored twice).
+
+SEARCH_COLUMNS = {
+    "students": ("name",),
+    "users": ("name", "login"),
+}
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+        dialect="postgresql"
+    ),
+)
+
+for _model, _columns in (
+    (Student, SEARCH_COLUMNS["students"]),
+    (User, SEARCH_COLUMNS["users"]),
+):
+    for _column in _columns:
+        Index(
+            f"ix_{_model.__tablename__}_{_column}_trgm",
+            getattr(_model, _column),
+            postgresql_using="gin",
+            postgresql_ops={_column: "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql")
+
+
+def sqlite_fts_ddl(table: str, columns) -> list:
+    """Statements creating the FTS5 table of `table` and its triggers."""
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, "
+        f"content='{table}', content_rowid='id', tokenize='trigram')",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} "
+        f"ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+for _table, _columns in SEARCH_COLUMNS.items():
+    for _statement in sqlite_fts_ddl(_table, _columns):
+        event.listen(
+            Base.metadata.tables[_table],
+            "after_create",
+            DDL(_statement).execute_if(dialect="sqlite"),
+        )
+    event.listen(
+        Base.metadata.tables[_table],
+        "before_drop",
+        DDL(f"DROP TABLE IF EXISTS {_table}_fts").execute_if(dialect="sqlite"),
     )
@@ -0,0 +1,168 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Keyset (cursor) pagination keyed on the primary key: instead of
+# OFFSET n, which still scans the n skipped rows, every page starts with
+# `WHERE id > :last_id ORDER BY id`, which is a single index range scan
+# whatever the depth of the page.
+#
+# Cursors are opaque to the client: base64 of {"id": <boundary id>,
+# "d": "next" | "prev"}. They are returned in the X-Next-Cursor and
+# X-Prev-Cursor response headers so the list payload stays unchanged.
+
+
+def encode_cursor(last_id: int, direction: str = "next") -> str:
+    raw = json.dumps({"id": last_id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id, direction = int(data["id"]), data["d"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if direction not in ("next", "prev"):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return last_id, direction
+
+
+class Page:
+    """One page of rows plus the cursors pointing to its neighbours."""
+
+    def __init__(self, rows, next_cursor=None, prev_cursor=None):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def keyset_statement(
+    stmt, id_column, cursor: Optional[str], skip: int, limit: int
+):
+    """
+    Add the keyset filter, ordering and LIMIT (one extra row to know if
+    there is a further page) to a select. `skip` is only honoured on the
+    first page, when no cursor is given, for backward compatibility.
+    """
+    limit = max(limit, 0)
+    if cursor is None:
+        return stmt.order_by(id_column).offset(skip).limit(limit + 1), "next"
+
+    last_id, direction = decode_cursor(cursor)
+    if direction == "prev":
+        stmt = stmt.where(id_column < last_id).order_by(id_column.desc())
+    else:
+        stmt = stmt.where(id_column > last_id).order_by(id_column)
+    return stmt.limit(limit + 1), direction
+
+
+def make_page(
+    rows, cursor: Optional[str], direction: str, skip: int, limit: int
+):
+    """Trim the extra row fetched by keyset_statement and build the cursors."""
+    limit = max(limit, 0)
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == "prev":
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+
+    if direction == "prev":
+        next_cursor = encode_cursor(rows[-1].id, "next")
+        prev_cursor = encode_cursor(rows[0].id, "prev") if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1].id, "next") if has_more else None
+        has_previous = cursor is not None or skip > 0
+        prev_cursor = (
+            encode_cursor(rows[0].id, "prev") if has_previous else None
+        )
+    return Page(rows, next_cursor, prev_cursor)
+
+
+async def total_count(db: AsyncSession, table, mode: str, filters=()):
+    """
+    Count the rows of `table` matching `filters`. "estimated" reads the
+    planner statistics on Postgres (no scan at all) and falls back to an
+    exact count elsewhere, when the table was never analyzed or when the
+    list is filtered.
+    Returns (count, is_estimate).
+    """
+    if (
+        mode == "estimated"
+        and not filters
+        and db.get_bind().dialect.name == "postgresql"
+    ):
+        estimate = await db.scalar(
+            text(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = :name"
+            ),
+            {"name": table.name},
+        )
+        if estimate is not None and estimate >= 0:
+            return int(estimate), True
+    count = await db.scalar(
+        select(func.count()).select_from(table).where(*filters)
+    )
+    return count, False
+
+
+async def fetch_page(
+    db: AsyncSession,
+    stmt,
+    id_column,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 15,
+    scalars: bool = True,
+) -> Page:
+    """
+    Run `stmt` as a keyset page.
+    With scalars=True the page holds ORM objects, otherwise result rows.
+    """
+    stmt, direction = keyset_statement(stmt, id_column, cursor, skip, limit)
+    result = (await db.execute(stmt)).unique()
+    rows = result.scalars().all() if scalars else result.all()
+    return make_page(rows, cursor, direction, skip, limit)
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt,
+    id_column,
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 15,
+    count: Optional[str] = None,
+    scalars: bool = True,
+    filters=(),
+) -> Page:
+    """
+    Fetch a keyset page of the rows of `stmt` matching `filters` and set the
+    pagination response headers.
+    """
+    stmt = stmt.where(*filters)
+    page = await fetch_page(db, stmt, id_column, cursor, skip, limit, scalars)
+    await set_page_headers(db, response, page, id_column.table, count, filters)
+    return page
+
+
+async def set_page_headers(
+    db, response: Response, page: Page, table, count, filters=()
+):
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.prev_cursor:
+        response.headers["X-Prev-Cursor"] = page.prev_cursor
+    if count:
+        total, is_estimate = await total_count(db, table, count, filters)
+        response.headers["X-Total-Count"] = str(total)
+        if is_estimate:
+            response.headers["X-Total-Count-Estimated"] = "true"
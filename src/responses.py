@@ -0,0 +1,47 @@
+from fastapi import Response
+
+try:
+    import orjson
+
+    def dumps(content) -> bytes:
+        return orjson.dumps(content)
+
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    import json
+
+    def dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for plain rows (dicts, lists, numbers, strings).
+
+    Returning it from a handler bypasses the response_model validation, so
+    it must only carry data that already has the documented shape.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def list_response(rows, response: Response) -> FastJSONResponse:
+    """Serialize `rows`, keeping the headers already set on `response`."""
+    headers = {
+        key: value
+        for key, value in response.headers.items()
+        if key != "content-length"
+    }
+    return FastJSONResponse(rows, headers=headers)
+
+
+def bulk_response(created, errors) -> FastJSONResponse:
+    """Bulk*Result of a batch write: created rows and rejected items."""
+    return FastJSONResponse(
+        {
+            "created": created,
+            "errors": [error.model_dump() for error in errors],
+        }
+    )
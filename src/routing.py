@@ -0,0 +1,67 @@
+import time
+from http.cookies import SimpleCookie
+
+import database
+
+# Read-replica routing.
+#
+# The read-only list endpoints open their session with get_read_db (main.py)
+# and read from the replica (REPLICA_DATABASE_URL); every other endpoint
+# uses the primary. A replica lags behind the primary, so a client that has
+# just written would not always see its write on the next read: after a
+# successful write (any method but GET, HEAD and OPTIONS answered below
+# 400) the middleware sets a cookie holding the time until which the client
+# reads from the primary, READ_YOUR_WRITES_WINDOW seconds later. The cookie
+# is not signed: forging it only sends the client's own reads to the
+# primary.
+
+STICKY_COOKIE = "read_primary_until"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def reads_from_primary(cookies: dict) -> bool:
+    """True while the read-your-writes window of the client is open."""
+    try:
+        return float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def sticky_cookie(window: float) -> bytes:
+    cookie = SimpleCookie()
+    cookie[STICKY_COOKIE] = f"{time.time() + window:.3f}"
+    cookie[STICKY_COOKIE]["max-age"] = max(1, round(window))
+    cookie[STICKY_COOKIE]["path"] = "/"
+    cookie[STICKY_COOKIE]["httponly"] = True
+    cookie[STICKY_COOKIE]["samesite"] = "Lax"
+    return cookie.output(header="").strip().encode("latin-1")
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI middleware setting the sticky cookie after writes."""
+
+    def __init__(self, app, window: float):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] < 400
+            ):
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", sticky_cookie(self.window)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def use_replica(request) -> bool:
+    """Whether the reads of this request may go to the replica."""
+    return database.has_replica() and not reads_from_primary(request.cookies)
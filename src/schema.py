@@ -36,7 +36,7 @@ class Student(BaseModel):
     id: int
     name: str
     lab: str
-    user_id: int  # include user id to associate user
+    user_id: Optional[int] = None  # NULL once the user is deleted
     # course_id: Optional[List[int]]=[]
 
     class Config:
@@ -89,3 +89,67 @@ class StudentWithCourse(Student):
 
 class CourseWithStudent(Course):
     students: List[Student] = []
+
+
+class BulkItemError(BaseModel):
+    index: int  # position of the rejected item in the submitted batch
+    detail: str
+
+
+class BulkStudentResult(BaseModel):
+    created: List[Student] = []
+    errors: List[BulkItemError] = []
+
+
+class BulkCourseResult(BaseModel):
+    created: List[Course] = []
+    errors: List[BulkItemError] = []
+
+
+class BulkUserResult(BaseModel):
+    created: List[User] = []
+    errors: List[BulkItemError] = []
+
+
+class BulkDeleteResult(BaseModel):
+    detail: str
+    deleted: List[int] = []
+    missing: List[int] = []  # requested ids that did not exist
+
+
+class LoginRequest(BaseModel):
+    login: str
+    password: str
+
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int  # seconds
+
+
+class CourseStats(BaseModel):
+    id: int
+    title: str
+    students: int
+
+
+class UserStats(BaseModel):
+    user_id: int
+    students: int
+
+
+class ImportJob(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued, running or done
+    total: int
+    processed: int
+    created: int
+    failed: int
+    progress: float  # processed / total
+    rows_per_sec: Optional[float] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    errors: List[BulkItemError] = []  # the first ones, by row index
@@ -0,0 +1,90 @@
+from typing import List, Optional
+
+from sqlalchemy import column, exists, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# Filters of the list endpoints, as WHERE clauses added to the keyset page
+# statements (so the pagination cursors keep working on filtered lists).
+#
+# Substring search on names and logins is case-insensitive and backed by
+# the indexes declared at the end of models.py:
+#   postgresql: ILIKE '%term%', served by the GIN trigram indexes
+#   sqlite:     MATCH on the FTS5 trigram tables; terms shorter than three
+#               characters have no trigram and fall back to a LIKE scan
+#   others:     ILIKE without index
+
+MIN_TRIGRAM_LENGTH = 3
+
+
+def like_pattern(term: str) -> str:
+    escaped = (
+        term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
+    return f"%{escaped}%"
+
+
+def fts_phrase(term: str) -> str:
+    # a quoted FTS5 string: the term is matched literally, operators and
+    # punctuation included
+    return '"' + term.replace('"', '""') + '"'
+
+
+def contains(db: AsyncSession, model, name: str, term: str):
+    """Case-insensitive substring filter on the column `name` of `model`."""
+    column_ = getattr(model, name)
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "sqlite" and len(term) >= MIN_TRIGRAM_LENGTH:
+        fts = table(
+            f"{model.__tablename__}_fts", column("rowid"), column(name)
+        )
+        matches = select(fts.c.rowid).where(
+            fts.c[name].op("MATCH")(fts_phrase(term))
+        )
+        return model.id.in_(matches)
+    return column_.ilike(like_pattern(term), escape="\\")
+
+
+def student_filters(
+    db: AsyncSession,
+    name: Optional[str] = None,
+    lab: Optional[str] = None,
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+) -> List:
+    filters = []
+    if name:
+        filters.append(contains(db, models.Student, "name", name))
+    if lab is not None:
+        filters.append(models.Student.lab == lab)
+    if user_id is not None:
+        filters.append(models.Student.user_id == user_id)
+    if course_id is not None:
+        # EXISTS rather than IN: walking the students in id order and
+        # probing the (student_id, course_id) primary key stops after one
+        # page, where IN first collects every student of the course
+        link = models.student_course
+        filters.append(
+            exists().where(
+                link.c.student_id == models.Student.id,
+                link.c.course_id == course_id,
+            )
+        )
+    return filters
+
+
+def user_filters(
+    db: AsyncSession,
+    name: Optional[str] = None,
+    login: Optional[str] = None,
+    role: Optional[str] = None,
+) -> List:
+    filters = []
+    if name:
+        filters.append(contains(db, models.User, "name", name))
+    if login:
+        filters.append(contains(db, models.User, "login", login))
+    if role is not None:
+        filters.append(models.User.role == role)
+    return filters
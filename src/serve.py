@@ -0,0 +1,73 @@
+"""
+Production entry point: several uvicorn worker processes on one socket.
+
+Every worker is a separate process with its own connection pool, cache and
+password hashing pool (nothing is shared but the database and, with
+CACHE_BACKEND=redis, the cache). With DB_MAX_CONNECTIONS set, the pools
+are sized so that all the workers together stay within that budget.
+
+On SIGTERM (or SIGINT) the supervisor stops the workers gracefully: they
+stop accepting connections, let the requests in flight, such as bulk
+student creations, finish for up to SHUTDOWN_TIMEOUT seconds, then close
+their pools. SIGTTIN / SIGTTOU add or remove one worker at run time (the
+pools of new workers are still sized for the initial number of workers).
+
+    python serve.py --workers 4 --port 8000
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+import config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.WEB_CONCURRENCY,
+        help="worker processes (default: WEB_CONCURRENCY)",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=config.SHUTDOWN_TIMEOUT,
+        help="seconds given to in-flight requests on shutdown",
+    )
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # the workers are spawned processes: they read the number of workers
+    # from the environment to size their pool (see config.py)
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    # without AUTH_SECRET each worker would draw its own random key and
+    # reject the tokens issued by the others: share the one drawn here
+    os.environ.setdefault("AUTH_SECRET", config.AUTH_SECRET)
+    if config.DB_CREATE_SCHEMA:
+        # once here, rather than by workers racing to create the same tables
+        import database
+        import models  # noqa: F401 (registers the tables)
+
+        database.Base.metadata.create_all(database.get_engine())
+        database.get_engine().dispose()
+        os.environ["DB_CREATE_SCHEMA"] = "false"
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,156 @@
-from passlib.context import CryptContext
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import config
+
+
+@functools.lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib is slow to import: deferred to the first password operation
+    from passlib.context import CryptContext
+
+    # hashes made with another cost are reported by needs_update and
+    # rehashed at the next successful verification, see
+    # verify_and_update_password
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=config.BCRYPT_ROUNDS,
+    )
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return (valid, new hash or None when the stored hash is current)."""
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hashing jobs are already waiting for a worker."""
+
+
+class PasswordHasher:
+    """
+    Run bcrypt in a dedicated, bounded worker pool.
+
+    The pool is separate from the default executor used by FastAPI for sync
+    code, and at most `workers` jobs are submitted at a time, so a burst of
+    password requests only queues up behind this pool instead of starving
+    the event loop. Jobs beyond `max_pending` are rejected with
+    PasswordPoolBusy.
+    """
+
+    def __init__(
+        self, kind: str = "thread", workers: int = 2, max_pending: int = 64
+    ):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._semaphore = None
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._executor
+
+    async def run(self, func, *args):
+        executor = self._get_executor()
+        if self.in_flight + self.queued >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolBusy("password hashing pool is saturated")
+
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    kind=config.PASSWORD_POOL_KIND,
+    workers=config.PASSWORD_POOL_WORKERS,
+    max_pending=config.PASSWORD_POOL_MAX_PENDING,
+)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(hash_password, password)
+
+
+async def verify_password_async(
+    plain_password: str, hashed_password: str
+) -> bool:
+    return await password_hasher.run(
+        verify_password, plain_password, hashed_password
+    )
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+):
+    return await password_hasher.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
+def hash_many(passwords):
+    return [hash_password(password) for password in passwords]
+
+
+async def hash_passwords_async(passwords):
+    """Hash a batch as at most `workers` pool jobs instead of one per item."""
+    if not passwords:
+        return []
+    size = -(-len(passwords) // password_hasher.workers)
+    chunks = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(
+        *[password_hasher.run(hash_many, chunk) for chunk in chunks]
+    )
+    return [hashed for chunk in results for hashed in chunk]
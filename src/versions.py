@@ -0,0 +1,124 @@
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+import cache
+import config
+import routing
+
+# Conditional GET for the list endpoints.
+#
+# Every table has a version counter, bumped by the handlers that write to
+# it, and the time of its last bump. The ETag of a list response is made
+# of the versions of the tables it reads and its Last-Modified is the most
+# recent bump, so a poll carrying If-None-Match or If-Modified-Since is
+# answered with a 304 after reading the counters only: no SQL query and no
+# serialization.
+#
+# With CACHE_BACKEND=redis the counters are shared by all the workers.
+# Otherwise each process keeps its own, which only sees the writes handled
+# by that process: a client could keep getting 304s from a worker after
+# another worker changed the data. The validators are then only issued when
+# the app is known to run in a single process (config.SINGLE_PROCESS).
+
+STARTED_AT = time.time()
+
+
+def build_store():
+    if isinstance(cache.cache, cache.RedisCache):
+        return cache.cache, "shared"
+    # the memory cache evicts entries and NullCache drops them, the
+    # counters get their own never-expiring store
+    return cache.LRUCache(max_entries=1000, ttl=0), uuid.uuid4().hex[:8]
+
+
+store, token = build_store()
+
+
+def validators_enabled() -> bool:
+    return token == "shared" or config.SINGLE_PROCESS
+
+
+def version_key(table: str) -> str:
+    return f"version:{table}"
+
+
+def modified_key(table: str) -> str:
+    return f"modified:{table}"
+
+
+async def bump(*tables: str):
+    """Mark `tables` as changed, to be called after the commit."""
+    now = time.time()
+    for table in tables:
+        await store.incr(version_key(table))
+        await store.set(modified_key(table), now, ttl=0)
+
+
+async def validators(*tables: str):
+    """Return (etag, last_modified timestamp) for data read from `tables`."""
+    values = await store.get_many(
+        [version_key(table) for table in tables]
+        + [modified_key(table) for table in tables]
+    )
+    versions = "-".join(
+        f"{table}.{value or 0}"
+        for table, value in zip(tables, values[: len(tables)])
+    )
+    modified = max(value or STARTED_AT for value in values[len(tables) :])
+    return f'W/"{token}-{versions}"', modified
+
+
+def not_modified(request: Request, etag: str, modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison, the ETags are the same whatever the encoding
+        tags = {
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        }
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have a one second resolution
+        return int(modified) <= since
+    return False
+
+
+async def conditional_get(
+    request: Request, response: Response, *tables: str
+) -> Optional[Response]:
+    """
+    Return a 304 response when the copy of the client is still current,
+    otherwise set the validators on `response` and return None.
+
+    The version of the data is also kept in request.state.etag, which
+    coalesce.py uses even when no validator is issued.
+    """
+    etag, modified = await validators(*tables)
+    request.state.etag = etag
+    # the replica may not have received a recent write yet: rows read from
+    # it could be older than the ETag says and must not be validated (nor
+    # cached, see coalesce.py) until the lag window is over
+    request.state.replica_lagging = (
+        routing.use_replica(request)
+        and time.time() - modified < config.READ_YOUR_WRITES_WINDOW
+    )
+    if not validators_enabled() or request.state.replica_lagging:
+        return None
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified, usegmt=True),
+        # the client may keep the response but has to revalidate it
+        "Cache-Control": "no-cache",
+    }
+    if not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None